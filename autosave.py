@@ -0,0 +1,175 @@
+"""
+Background autosave for the in-memory storages (PhoneBook.start_autosave, used by main.py).
+
+Saving blocks while the whole book is serialized, so instead of saving on the caller's thread:
+
+1. a snapshot of the book is taken, cheap enough to do between two changes: the 'objects' storage copies its
+   id -> contact dict (pointers only) and keeps the contacts copy-on-write, i.e. a contact changed while the snapshot
+   is being written is copied out first (PhoneBook._before_change); the 'columns' storage copies its arrays
+2. a worker thread writes the snapshot to a temp file and renames it over the contacts file, then drops the journal
+   records the snapshot holds (see Journal.drop_through)
+
+A save starts once dirty_threshold changes piled up (checked after every change), once the journal is due for
+compaction (PhoneBook.compact_every records, the save compacts it), or interval seconds after the last one when
+anything changed. The timer takes its snapshot while holding `lock`, which PhoneBook's mutators
+hold around each change (see PhoneBook._changing), so a snapshot never falls in the middle of one. Only the
+changes themselves hold it, not e.g. a menu command waiting for input.
+
+With metrics on (see metrics.py) the snapshot pause is reported as 'autosave_snapshot' and the write as
+'autosave_write'.
+"""
+import threading
+import time
+
+from snapshot import LazyContacts
+import log_pipeline
+import metrics
+
+logger = log_pipeline.get_logger('save')
+
+DEFAULT_INTERVAL = 60.0
+DEFAULT_DIRTY_THRESHOLD = 1_000
+
+
+class Snapshot:
+    """The contacts as of one generation of the book, and the journal mark they go with."""
+
+    def __init__(self, generation, contacts, journal_mark, copy_on_write):
+        self.generation = generation
+        # a mapping nobody changes: a copy of the storage (its contacts may still be shared, see preserve)
+        self.contacts = contacts
+        self.journal_mark = journal_mark
+        self.copy_on_write = copy_on_write
+        self._entries = contacts._entries if isinstance(contacts, LazyContacts) else contacts
+        # id -> copy of a shared contact taken before it was changed
+        self.originals = {}
+
+    def preserve(self, contact):
+        """Called before a contact changes in place: keep it as it is if the snapshot shares it."""
+        if not self.copy_on_write:
+            return
+        contact_id = contact.contact_id
+        if self._entries.get(contact_id) is contact and contact_id not in self.originals:
+            self.originals[contact_id] = contact.copy()
+
+    def records(self):
+        """(id, Contact or encoded record) pairs as of the snapshot, see snapshot.write_snapshot."""
+        records = self.contacts.records() if isinstance(self.contacts, LazyContacts) else self.contacts.items()
+        if not self.copy_on_write:
+            yield from records
+            return
+        originals = self.originals
+        for contact_id, contact in records:
+            if not isinstance(contact, bytes):
+                # read the contact before looking for an original: a change copies it out before it starts,
+                # so if the read could have seen the change, the original is there already
+                contact = contact.copy()
+                contact = originals.get(contact_id, contact)
+            yield contact_id, contact
+
+
+class Autosaver:
+
+    def __init__(self, phone_book, interval=DEFAULT_INTERVAL, dirty_threshold=DEFAULT_DIRTY_THRESHOLD):
+        if phone_book.storage == 'sqlite':
+            raise ValueError("The sqlite storage commits every change, there is nothing to autosave")
+        self.phone_book = phone_book
+        # seconds, None for saves on the dirty threshold only
+        self.interval = interval
+        self.dirty_threshold = dirty_threshold
+        # held by PhoneBook around each change, the timer takes it for its snapshots
+        self.lock = threading.RLock()
+        self.saves = 0
+        self.failures = 0
+        self.snapshot_seconds = 0.0
+        self.write_seconds = 0.0
+        self._last_save = time.monotonic()
+        # the snapshot handed to the worker, until it is written
+        self._pending = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='autosave', daemon=True)
+
+    @property
+    def dirty(self):
+        """Changes since the last save."""
+        return self.phone_book.generation - self.phone_book.saved_generation
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the worker once the save in progress (if any) is written, the caller saves what's left.
+
+        Not while holding lock, the worker may be waiting for it.
+        """
+        self._stopping = True
+        self._wake.set()
+        self._thread.join()
+
+    def changed(self, force=False):
+        """
+        Called by PhoneBook after every change: hand a snapshot to the worker once enough changes piled up.
+
+        force hands one over whatever the count, PhoneBook does when the journal is due for compaction.
+        """
+        if self._pending is None and (force or self.dirty >= self.dirty_threshold):
+            with self.lock:
+                if self._pending is None:
+                    self._snapshot_now()
+            self._wake.set()
+
+    def _snapshot_now(self):
+        started = time.perf_counter()
+        self._pending = self.phone_book._take_snapshot()
+        self.snapshot_seconds = time.perf_counter() - started
+        if metrics.enabled():
+            metrics.observe('autosave_snapshot', self.snapshot_seconds)
+
+    def _due(self):
+        return (self.interval is not None and self.dirty
+                and time.monotonic() - self._last_save >= self.interval)
+
+    def _run(self):
+        while True:
+            if self.interval is None:
+                self._wake.wait()
+            else:
+                self._wake.wait(max(0.0, self._last_save + self.interval - time.monotonic()))
+            self._wake.clear()
+            if self._pending is None and self._due() and not self._stopping:
+                with self.lock:
+                    if self._pending is None:
+                        self._snapshot_now()
+            if self._pending is not None:
+                self._write(self._pending)
+            elif not self.dirty:
+                # nothing to save, wait a whole interval from now
+                self._last_save = time.monotonic()
+            if self._stopping:
+                return
+
+    def _write(self, snapshot):
+        started = time.perf_counter()
+        error = None
+        try:
+            if self.phone_book._save_snapshot(snapshot):
+                self.saves += 1
+        except Exception as e:
+            # the journal still has every change, the next save tries again
+            error = e
+            self.failures += 1
+            logger.exception("Autosave failed")
+        finally:
+            self.phone_book._snapshot = None
+            self._pending = None
+            self._last_save = time.monotonic()
+        self.write_seconds = time.perf_counter() - started
+        if metrics.enabled():
+            metrics.observe('autosave_write', self.write_seconds, error)
+
+    def stats(self):
+        return {'saves': self.saves, 'failures': self.failures, 'dirty': self.dirty,
+                'snapshot_seconds': self.snapshot_seconds, 'write_seconds': self.write_seconds}
@@ -0,0 +1,58 @@
+"""
+Benchmark the pause a save puts on the caller: a blocking save_contacts against a background autosave
+(the snapshot taken on the caller's thread, then updates keep going while the worker writes).
+
+    python3 -m benchmarks.bench_autosave [book size]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import make_contacts
+from phone_book import PhoneBook
+
+BOOK_SIZE = 200_000
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else BOOK_SIZE
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage in ('objects', 'columns'):
+            path = os.path.join(tmp, f'{storage}.json')
+            phone_book = PhoneBook(path, storage=storage, journal_file=path + '.journal', history_file=os.devnull,
+                                   compact_every=10 ** 9)
+            phone_book.contacts = make_contacts(size)
+            phone_book.update_next_id()
+
+            began = time.perf_counter()
+            phone_book.save_contacts()
+            blocking = time.perf_counter() - began
+
+            phone_book.update_contact(phone_book.get_contact_by_id(1), log=False, first_name='Changed')
+            began = time.perf_counter()
+            book_snapshot = phone_book._take_snapshot()
+            pause = time.perf_counter() - began
+            writer = threading.Thread(target=phone_book._save_snapshot, args=(book_snapshot,))
+            writer.start()
+            # the slowest update while the snapshot is being written
+            updates = 0
+            slowest = 0.0
+            while writer.is_alive():
+                contact = phone_book.get_contact_by_id(rng.randrange(1, size + 1))
+                began = time.perf_counter()
+                phone_book.update_contact(contact, log=False, address=f'{updates} Elm St')
+                slowest = max(slowest, time.perf_counter() - began)
+                updates += 1
+            writer.join()
+            phone_book.journal.close()
+            print(f"{storage:>8}: blocking save {blocking * 1e3:.0f} ms, autosave snapshot pause {pause * 1e3:.2f} ms, "
+                  f"{updates:,} updates while writing (slowest {slowest * 1e3:.2f} ms), "
+                  f"{len(book_snapshot.originals):,} contacts copied on write")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Benchmark bulk_update against update_contact in a loop (updates/sec), with the journal and the history store."""
+import os
+import tempfile
+import time
+
+from benchmarks.common import make_contacts
+from phone_book import PhoneBook
+
+BOOK_SIZE = 200_000
+UPDATES = 100_000
+
+
+def changes(sync):
+    for i in range(UPDATES):
+        contact_id = i * 7 % BOOK_SIZE + 1
+        yield contact_id, {'address': f"{sync} Sync St", 'email_address': f"user{contact_id}.{sync}@example.com"}
+
+
+def new_book(tmp, name):
+    phone_book = PhoneBook(os.path.join(tmp, f'{name}.json'), journal_file=os.path.join(tmp, f'{name}.journal'),
+                           compact_every=UPDATES * 10)
+    phone_book.contacts = make_contacts(BOOK_SIZE)
+    # with the indexes built, so their maintenance is part of the cost
+    phone_book.search_contacts('Smith')
+    phone_book.sort_contacts()
+    return phone_book
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        phone_book = new_book(tmp, 'loop')
+        start = time.perf_counter()
+        for contact_id, fields in changes(1):
+            phone_book.update_contact(phone_book.get_contact_by_id(contact_id), log=False, **fields)
+        seconds = time.perf_counter() - start
+        print(f"update_contact loop: {UPDATES / seconds:>10,.0f} updates/sec")
+
+        for batch_size in (1_000, UPDATES):
+            phone_book = new_book(tmp, f'bulk{batch_size}')
+            batch = list(changes(1))
+            start = time.perf_counter()
+            for offset in range(0, UPDATES, batch_size):
+                phone_book.bulk_update(batch[offset:offset + batch_size])
+            seconds = time.perf_counter() - start
+            print(f"bulk_update x{batch_size:<7} {UPDATES / seconds:>10,.0f} updates/sec")
+
+
+if __name__ == '__main__':
+    main()
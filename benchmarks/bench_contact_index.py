@@ -0,0 +1,34 @@
+"""
+Benchmark id lookups and batch deletes against the book size.
+
+Both should stay flat as n grows since they go through the id index.
+"""
+import os
+import random
+
+from benchmarks.common import make_contacts, timed
+from phone_book import PhoneBook
+
+SIZES = [10_000, 100_000, 300_000]
+LOOKUPS = 10_000
+DELETES = 2_000
+
+
+def main():
+    print(f"{'contacts':>10} {'lookup (us)':>12} {'batch delete (ms)':>18} {'per delete (us)':>16}")
+    for n in SIZES:
+        phone_book = PhoneBook(os.devnull, history_file=os.devnull)
+        phone_book.contacts = make_contacts(n)
+        rng = random.Random(n)
+        ids = [rng.randrange(1, n + 1) for _ in range(LOOKUPS)]
+
+        _, lookup_seconds = timed(lambda: [phone_book.get_contact_by_id(contact_id) for contact_id in ids])
+        delete_ids = rng.sample(range(1, n + 1), DELETES)
+        _, delete_seconds = timed(phone_book.delete_contacts, delete_ids)
+
+        print(f"{n:>10} {lookup_seconds / LOOKUPS * 1e6:>12.3f} {delete_seconds * 1e3:>18.3f} "
+              f"{delete_seconds / DELETES * 1e6:>16.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Benchmark filter_contacts_by_date (sorted index + bisect) against comparing every contact."""
+import datetime
+import os
+
+from benchmarks.common import BASE_TIME, make_contacts, timed
+from phone_book import PhoneBook
+
+SIZES = [10_000, 100_000, 300_000]
+WINDOWS = [datetime.timedelta(hours=1), datetime.timedelta(days=1), datetime.timedelta(days=30)]
+
+
+def scan(phone_book, start_date, end_date):
+    return [c for c in phone_book.contacts if start_date <= c.created_at <= end_date]
+
+
+def main():
+    print(f"{'contacts':>10} {'window':>18} {'hits':>7} {'indexed (ms)':>13} {'scan (ms)':>10}")
+    start_date = BASE_TIME + datetime.timedelta(days=400)
+    for n in SIZES:
+        phone_book = PhoneBook(os.devnull, history_file=os.devnull, cache_size=0)
+        phone_book.contacts = make_contacts(n)
+        phone_book.filter_contacts_by_date(start_date, start_date)
+        for window in WINDOWS:
+            end_date = start_date + window
+            results, indexed_seconds = timed(phone_book.filter_contacts_by_date, start_date, end_date, repeat=100)
+            expected, scan_seconds = timed(scan, phone_book, start_date, end_date, repeat=3)
+            assert {c.contact_id for c in results} == {c.contact_id for c in expected}
+            print(f"{n:>10} {str(window):>18} {len(results):>7} {indexed_seconds * 1e3:>13.3f} "
+                  f"{scan_seconds * 1e3:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
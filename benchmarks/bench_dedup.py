@@ -0,0 +1,60 @@
+"""Benchmark find_duplicates and import-time matching on synthetic data with planted duplicates."""
+import collections
+import random
+
+from benchmarks.common import timed
+import dedup
+
+N = 1_000_000
+DUPLICATE_RATE = 0.01
+SYLLABLES = ['an', 'ber', 'cal', 'dor', 'el', 'fin', 'gar', 'hol', 'is', 'jon', 'kel', 'lin', 'mar', 'nor', 'os',
+             'per', 'quin', 'ros', 'son', 'tor', 'ul', 'ven', 'wil', 'xan', 'yor', 'zel']
+
+# find_duplicates only needs these attributes, plain tuples keep a million rows cheap to build
+Row = collections.namedtuple('Row', ['contact_id', 'first_name', 'last_name', 'phone_number', 'email_address'])
+
+
+def random_name(rng, syllables):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(syllables)).capitalize()
+
+
+def synthetic_rows(n, seed=7):
+    rng = random.Random(seed)
+    first_names = [random_name(rng, 2) + random_name(rng, 1).lower() for _ in range(5_000)]
+    last_names = [random_name(rng, 4) for _ in range(200_000)]
+    phones = rng.sample(range(2_000_000_000, 9_999_999_999), n)
+    rows = [Row(contact_id, rng.choice(first_names), rng.choice(last_names),
+                f"({phone // 10**7}) {phone // 10**4 % 1000:03d}-{phone % 10**4:04d}", f"user{contact_id}@example.com")
+            for contact_id, phone in enumerate(phones, 1)]
+    # plant duplicates: same phone, same email in another case, or a one letter typo in the first name
+    for i in range(int(n * DUPLICATE_RATE)):
+        original = rows[rng.randrange(n)]
+        kind = i % 3
+        rows.append(Row(
+            len(rows) + 1,
+            original.first_name[:-1] if kind == 2 else random_name(rng, 4),
+            original.last_name if kind == 2 else random_name(rng, 4),
+            original.phone_number if kind == 0 else f"(111) 111-{i % 10000:04d}",
+            original.email_address.upper() if kind == 1 else f"dup{i}@example.org",
+        ))
+    return rows
+
+
+def main():
+    rows = synthetic_rows(N)
+    groups, seconds = timed(dedup.find_duplicates, rows)
+    reasons = collections.Counter(reason for _, group_reasons in groups for reason in group_reasons)
+    print(f"find_duplicates: {len(rows)} contacts in {seconds:.1f}s ({len(rows) / seconds:,.0f} contacts/sec), "
+          f"{len(groups)} groups, reasons {dict(reasons)}")
+
+    finder, build_seconds = timed(dedup.DuplicateFinder, rows[:N])
+    planted = rows[N:]
+    matches, match_seconds = timed(lambda: [finder.match(row.first_name, row.last_name, row.phone_number,
+                                                         row.email_address) for row in planted])
+    print(f"DuplicateFinder: built over {N} contacts in {build_seconds:.1f}s, "
+          f"{len(planted) / match_seconds:,.0f} matches/sec, {sum(1 for match in matches if match)} of "
+          f"{len(planted)} planted duplicates found")
+
+
+if __name__ == '__main__':
+    main()
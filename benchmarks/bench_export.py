@@ -0,0 +1,54 @@
+"""
+Benchmark export_contacts: rows/sec per format, and the memory the export itself allocates (tracemalloc peak),
+which should stay flat as the book grows (a search keeps its candidate ids, so it grows with the matches).
+Throughput is measured first, without tracemalloc, which slows the export down a lot. The exported CSV is imported again to check the round trip.
+
+    python3 -m benchmarks.bench_export [book size]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.common import BASE_TIME, make_contacts
+from phone_book import PhoneBook
+
+BOOK_SIZE = 200_000
+EXPORTS = [
+    ('contacts.csv', {}),
+    ('contacts.csv.gz', {}),
+    ('contacts.ndjson', {}),
+    ('contacts.ndjson.gz', {}),
+    ('projected.ndjson', {'fields': ['id', 'phone_number']}),
+    ('recent.csv', {'start_date': BASE_TIME + datetime.timedelta(days=600)}),
+    ('search.csv', {'query': 'Smith'}),
+]
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else BOOK_SIZE
+    with tempfile.TemporaryDirectory() as tmp:
+        phone_book = PhoneBook(os.path.join(tmp, 'book.json'), history_file=os.devnull)
+        phone_book.contacts = make_contacts(size)
+        # the indexes belong to the book, not to the export
+        phone_book.search_contacts('Smith')
+        phone_book.filter_contacts_by_date(BASE_TIME, BASE_TIME)
+        list(phone_book.iter_contacts_by_date(BASE_TIME, BASE_TIME, 'updated_at'))
+        print(f"{size:,} contacts")
+        for name, options in EXPORTS:
+            path = os.path.join(tmp, name)
+            report = phone_book.export_contacts(path, **options)
+            tracemalloc.start()
+            phone_book.export_contacts(path, **options)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:>20} {report.rows:>9,} rows {report.rows_per_sec:>10,.0f} rows/sec "
+                  f"{os.path.getsize(path) / 2 ** 20:>8.1f} MB  peak {peak / 2 ** 20:.1f} MB")
+        copy = PhoneBook(os.path.join(tmp, 'copy.json'), history_file=os.devnull)
+        report = copy.batch_import(os.path.join(tmp, 'contacts.csv'), error_file=os.path.join(tmp, 'rejects.csv'))
+        print(f"round trip: imported {report.imported:,} of {report.rows:,} exported rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark the history store: bytes per change against the inline JSON history contacts.json used to carry,
+load time of a book with a lot of history, and history lookups (first one builds the offset table).
+"""
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.common import make_contacts
+from phone_book import PhoneBook
+
+BOOK_SIZE = 50_000
+SYNCS = 10
+LOOKUPS = 1_000
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        contacts_file = os.path.join(tmp, 'contacts.json')
+        phone_book = PhoneBook(contacts_file)
+        phone_book.contacts = make_contacts(BOOK_SIZE)
+        # every contact syncs a few times, each sync changing the email and the address
+        start = time.perf_counter()
+        for sync in range(SYNCS):
+            for contact in phone_book.contacts:
+                phone_book.update_contact(contact, log=False, address=f"{sync} Sync St",
+                                          email_address=f"user{contact.contact_id}.{sync}@example.com")
+        seconds = time.perf_counter() - start
+        phone_book.save_contacts()
+        changes = BOOK_SIZE * SYNCS * 2
+        print(f"updates:            {BOOK_SIZE * SYNCS / seconds:>10,.0f} updates/sec")
+
+        store_bytes = os.path.getsize(phone_book.history.path)
+        inline_bytes = sum(len(json.dumps(phone_book.get_contact_history(contact_id), indent=4, default=str))
+                           for contact_id in range(1, BOOK_SIZE + 1))
+        print(f"inline JSON:        {inline_bytes / changes:>10.1f} bytes/change")
+        print(f"history store:      {store_bytes / changes:>10.1f} bytes/change")
+        phone_book.history.max_changes = SYNCS
+        phone_book.history.compact()
+        print(f"after compact():    {os.path.getsize(phone_book.history.path) / changes:>10.1f} bytes/change "
+              f"(last {SYNCS} changes kept)")
+        print(f"contacts.json:      {os.path.getsize(contacts_file) / BOOK_SIZE:>10.1f} bytes/contact")
+
+        start = time.perf_counter()
+        phone_book = PhoneBook(contacts_file)
+        phone_book.load_contacts()
+        print(f"load:               {time.perf_counter() - start:>10.2f} s (history not read)")
+        start = time.perf_counter()
+        phone_book.get_contact_history(1)
+        print(f"first lookup:       {(time.perf_counter() - start) * 1000:>10.1f} ms (builds the offset table)")
+        start = time.perf_counter()
+        for contact_id in range(1, LOOKUPS + 1):
+            phone_book.get_contact_history(contact_id * 37 % BOOK_SIZE + 1)
+        print(f"lookups:            {LOOKUPS / (time.perf_counter() - start):>10,.0f} /sec")
+
+
+if __name__ == '__main__':
+    main()
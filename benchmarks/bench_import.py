@@ -0,0 +1,26 @@
+"""Benchmark batch_import throughput (rows/sec) inline and with the validation process pool."""
+import os
+import tempfile
+
+from benchmarks.common import write_csv
+from phone_book import PhoneBook
+
+SIZES = [10_000, 100_000, 500_000]
+
+
+def main():
+    print(f"{'rows':>10} {'workers':>8} {'imported':>9} {'rejected':>9} {'seconds':>8} {'rows/sec':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in SIZES:
+            csv_file_path = os.path.join(tmp, f"contacts_{n}.csv")
+            write_csv(csv_file_path, n, invalid_every=20)
+            for workers in (1, os.cpu_count()):
+                phone_book = PhoneBook(os.devnull, history_file=os.devnull)
+                report = phone_book.batch_import(csv_file_path, workers=workers,
+                                                 error_file=os.path.join(tmp, 'rejects.csv'))
+                print(f"{n:>10} {workers:>8} {report.imported:>9} {report.rejected:>9} "
+                      f"{report.seconds:>8.2f} {report.rows_per_sec:>10,.0f}")
+
+
+if __name__ == '__main__':
+    main()
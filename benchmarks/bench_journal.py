@@ -0,0 +1,46 @@
+"""Benchmark durable mutations per second with the journal, against saving the whole book after each change."""
+import os
+import tempfile
+import time
+
+from benchmarks.common import make_contacts
+from phone_book import PhoneBook
+
+BOOK_SIZE = 50_000
+UPDATES = 5_000
+
+
+def run(phone_book, updates, after_each=None):
+    start = time.perf_counter()
+    for i in range(updates):
+        contact = phone_book.get_contact_by_id(i % BOOK_SIZE + 1)
+        phone_book.update_contact(contact, address=f"{i} Journal Rd")
+        if after_each:
+            after_each()
+    return time.perf_counter() - start
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        contacts_file = os.path.join(tmp, 'contacts.json')
+        phone_book = PhoneBook(contacts_file, journal_file=os.path.join(tmp, 'contacts.journal'),
+                               compact_every=UPDATES * 2)
+        phone_book.contacts = make_contacts(BOOK_SIZE)
+        seconds = run(phone_book, UPDATES)
+        phone_book.journal.sync()
+        print(f"journal:            {UPDATES / seconds:>10,.0f} updates/sec "
+              f"({os.path.getsize(phone_book.journal.path) / UPDATES:.0f} bytes/update)")
+
+        start = time.perf_counter()
+        phone_book.save_contacts()
+        print(f"compaction:         {time.perf_counter() - start:>10.2f} s for {BOOK_SIZE} contacts")
+
+        phone_book = PhoneBook(contacts_file)
+        phone_book.contacts = make_contacts(BOOK_SIZE)
+        updates = 5
+        seconds = run(phone_book, updates, after_each=phone_book.save_contacts)
+        print(f"save after update:  {updates / seconds:>10,.1f} updates/sec")
+
+
+if __name__ == '__main__':
+    main()
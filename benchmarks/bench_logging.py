@@ -0,0 +1,78 @@
+"""
+Benchmark the cost of logging on add/update loops and batch_import.
+
+Modes: logging disabled, a plain FileHandler (writes in the calling thread), the background queue of
+log_pipeline.py, and the queue with update records sampled 1 in 100. 'drained' includes waiting for
+the writer thread to empty the queue. Logs go to a temp directory, never logs/phone_book.log.
+"""
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.common import write_csv
+from contact import Contact
+from phone_book import PhoneBook
+import log_pipeline
+
+OPERATIONS = 20_000
+IMPORT_ROWS = 100_000
+MODES = ['off', 'sync', 'queue', 'queue sampled']
+
+
+def start(mode, log_file):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    log_pipeline.configure_operation('update', sample_every=None)
+    if mode == 'off':
+        # a handler on the root logger keeps PhoneBook from setting up logs/phone_book.log
+        root.addHandler(logging.NullHandler())
+        logging.disable(logging.CRITICAL)
+        return
+    logging.disable(logging.NOTSET)
+    if mode == 'sync':
+        handler = logging.FileHandler(log_file)
+        handler.setFormatter(logging.Formatter(log_pipeline.LOG_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        operations = {'update': {'sample_every': 100}} if mode == 'queue sampled' else None
+        log_pipeline.setup_logging(log_file, operations=operations)
+
+
+def run(mode, tmp, csv_file_path):
+    log_file = os.path.join(tmp, f"{mode.replace(' ', '_')}.log")
+    start(mode, log_file)
+    phone_book = PhoneBook(contacts_file=os.path.join(tmp, 'contacts.json'))
+    began = time.perf_counter()
+    for i in range(OPERATIONS):
+        phone_book.add_contact(Contact(phone_book.get_next_contact_id(), 'Jane', f'Doe{i}', f"(555) 555-{i % 10000:04d}",
+                                       f"jane{i}@example.com", f"{i} Main St"))
+    add_seconds = time.perf_counter() - began
+    began = time.perf_counter()
+    for contact in list(phone_book.contacts):
+        phone_book.update_contact(contact, address='1 New St', email_address='moved@example.com')
+    update_seconds = time.perf_counter() - began
+    report = phone_book.batch_import(csv_file_path, workers=1, error_file=os.path.join(tmp, 'rejects.csv'))
+    log_pipeline.shutdown_logging()
+    drained = time.perf_counter() - began + add_seconds
+    size = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    return add_seconds, update_seconds, report.seconds, drained, size
+
+
+def main():
+    print(f"{'mode':>14} {'adds/sec':>10} {'updates/sec':>12} {'import rows/sec':>16} {'drained s':>10} {'log MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_file_path = os.path.join(tmp, 'contacts.csv')
+        write_csv(csv_file_path, IMPORT_ROWS, invalid_every=20)
+        for mode in MODES:
+            add_seconds, update_seconds, import_seconds, drained, size = run(mode, tmp, csv_file_path)
+            print(f"{mode:>14} {OPERATIONS / add_seconds:>10,.0f} {OPERATIONS / update_seconds:>12,.0f} "
+                  f"{IMPORT_ROWS / import_seconds:>16,.0f} {drained:>10.2f} {size / 1e6:>8.1f}")
+        start('off', None)
+
+
+if __name__ == '__main__':
+    main()
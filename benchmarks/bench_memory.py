@@ -0,0 +1,64 @@
+"""Report bytes per contact for a __dict__ based contact (the old layout), __slots__ Contact and column storage."""
+import gc
+import os
+import tracemalloc
+
+from benchmarks.common import contact_rows
+from contact import Contact
+from phone_book import PhoneBook
+
+N = 200_000
+
+
+class DictContact:
+    """The original Contact layout: a __dict__ per object, two datetime objects and a history list."""
+
+    def __init__(self, row):
+        self.contact_id = row['id']
+        self.first_name = row['first_name']
+        self.last_name = row['last_name']
+        self.phone_number = row['phone_number']
+        self.email_address = row['email_address']
+        self.address = row['address']
+        self.created_at = row['created_at']
+        self.updated_at = row['updated_at']
+        self.history = []
+
+
+def build_dict_contacts(rows):
+    return {row['id']: DictContact(row) for row in rows}
+
+
+def build_phone_book(storage):
+    def build(rows):
+        phone_book = PhoneBook(os.devnull, storage=storage, history_file=os.devnull)
+        phone_book.contacts = (Contact(row['id'], row['first_name'], row['last_name'], row['phone_number'],
+                                       row['email_address'], row['address'], row['created_at'], row['updated_at'],
+                                       validate=False) for row in rows)
+        return phone_book
+    return build
+
+
+def measure(build):
+    """Bytes still allocated per contact once the source rows are gone."""
+    gc.collect()
+    tracemalloc.start()
+    rows = list(contact_rows(N))
+    result = build(rows)
+    del rows
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size / N
+
+
+def main():
+    print(f"{N} contacts, bytes per contact")
+    print(f"{'__dict__ objects (old)':>24}: {measure(build_dict_contacts):8.1f}")
+    print(f"{'__slots__ objects':>24}: {measure(build_phone_book('objects')):8.1f}")
+    print(f"{'columns':>24}: {measure(build_phone_book('columns')):8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark the overhead of metrics.py on hot operations: disabled (methods not wrapped) against enabled.
+
+    python3 -m benchmarks.bench_metrics [book size]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import make_contacts
+from contact import Contact
+from phone_book import PhoneBook
+import metrics
+
+BOOK_SIZE = 100_000
+OPERATIONS = 50_000
+
+
+def run(tmp, size):
+    phone_book = PhoneBook(os.path.join(tmp, 'contacts.json'), history_file=os.devnull)
+    phone_book.contacts = make_contacts(size)
+    phone_book.update_next_id()
+    phone_book.search_contacts('Smith1')
+    timings = {}
+
+    began = time.perf_counter()
+    for i in range(1, OPERATIONS + 1):
+        phone_book.get_contact_by_id(i)
+    timings['get_contact_by_id'] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    for i in range(OPERATIONS):
+        phone_book.add_contact(Contact(phone_book.get_next_contact_id(), 'Jane', f'Doe{i}', '(555) 555-0100'))
+    timings['add_contact'] = time.perf_counter() - began
+
+    contacts = [phone_book.get_contact_by_id(i) for i in range(1, OPERATIONS + 1)]
+    began = time.perf_counter()
+    for contact in contacts:
+        phone_book.update_contact(contact, address='1 New St')
+    timings['update_contact'] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    for i in range(OPERATIONS // 10):
+        phone_book.search_contacts(f'Johnson{i % 1000}')
+    timings['search_contacts'] = time.perf_counter() - began
+    return timings
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else BOOK_SIZE
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('disabled', 'enabled'):
+            if mode == 'enabled':
+                metrics.enable()
+            results[mode] = run(tmp, size)
+            metrics.disable()
+    print(f"{'operation':>18} {'disabled':>12} {'enabled':>12} {'overhead':>9}")
+    for operation, disabled in results['disabled'].items():
+        enabled = results['enabled'][operation]
+        print(f"{operation:>18} {disabled:>11.3f}s {enabled:>11.3f}s {enabled / disabled - 1:>8.1%}")
+    for operation, op in metrics.stats()['operations'].items():
+        print(f"{operation}: {op['count']} calls, mean {op['mean_seconds'] * 1e6:.1f} us, "
+              f"max {op['max_seconds'] * 1e3:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark reverse phone lookups (lookup_by_phone / lookup_by_phones) against finding the number with search_contacts.
+
+Numbers are looked up as a telephony integration would send them, digits only or +1 prefixed.
+
+    python3 -m benchmarks.bench_phone_lookup [book size]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.common import make_contacts
+from phone_book import PhoneBook
+
+BOOK_SIZE = 200_000
+LOOKUPS = 100_000
+SEARCHES = 20
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else BOOK_SIZE
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage in PhoneBook.STORAGES:
+            path = os.path.join(tmp, 'contacts.db' if storage == 'sqlite' else 'contacts.json')
+            phone_book = PhoneBook(path, storage=storage, history_file=os.devnull, cache_size=0)
+            phone_book.contacts = make_contacts(size)
+            phones = [contact.phone_number for contact in rng.sample(phone_book.contacts, 1000)]
+            numbers = [(phone.translate(str.maketrans('', '', '() -')) if i % 2 else '+1 ' + phone)
+                       for i, phone in enumerate(phones)]
+            lookups = [numbers[i % len(numbers)] for i in range(LOOKUPS)]
+
+            began = time.perf_counter()
+            phone_book.lookup_by_phone(numbers[0])
+            build = time.perf_counter() - began
+            began = time.perf_counter()
+            found = sum(1 for number in lookups if phone_book.lookup_by_phone(number))
+            single = time.perf_counter() - began
+            began = time.perf_counter()
+            batch_found = sum(1 for result in phone_book.lookup_by_phones(lookups) if result)
+            batch = time.perf_counter() - began
+            began = time.perf_counter()
+            for phone in phones[:SEARCHES]:
+                phone_book.search_contacts(phone.replace('(', r'\(').replace(')', r'\)'))
+            search = (time.perf_counter() - began) / SEARCHES
+            assert found == batch_found == LOOKUPS
+            print(f"{storage:>8}: index build {build * 1e3:.0f} ms, lookup_by_phone {LOOKUPS / single:,.0f}/sec, "
+                  f"lookup_by_phones {LOOKUPS / batch:,.0f}/sec, search_contacts {search * 1e3:.1f} ms per number")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark composite queries (PhoneBook.query) against answering them the old way: one list per filter from
+search_contacts / filter_contacts_by_date, intersected, the rest filtered, sorted and sliced.
+
+The indexes are built before timing, both ways use them.
+
+    python3 -m benchmarks.bench_query [book size]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import BASE_TIME, make_contacts
+from phone_book import PhoneBook
+
+BOOK_SIZE = 200_000
+REPEAT = 20
+
+YEAR = (BASE_TIME + datetime.timedelta(days=365), BASE_TIME + datetime.timedelta(days=730))
+MONTH = (BASE_TIME + datetime.timedelta(days=400), BASE_TIME + datetime.timedelta(days=430))
+
+
+def _name_key(contact):
+    return contact.last_name, contact.first_name, contact.contact_id
+
+
+def _intersect(*results):
+    ids = set.intersection(*({contact.contact_id for contact in result} for result in results))
+    return [contact for contact in results[0] if contact.contact_id in ids]
+
+
+# (name, query, the same with lists)
+CASES = [
+    ("last name prefix + created in a year, by name, top 20",
+     lambda pb: pb.query().name_prefix('smith1').created_between(*YEAR).order_by('last_name').limit(20),
+     lambda pb: sorted(_intersect(pb.search_contacts('^smith1'), pb.filter_contacts_by_date(*YEAR)),
+                       key=_name_key)[:20]),
+    ("created in a month, newest 20",
+     lambda pb: pb.query().created_between(*MONTH).order_by('created_at', descending=True).limit(20),
+     lambda pb: sorted(pb.filter_contacts_by_date(*MONTH), key=lambda contact: contact.created_at,
+                       reverse=True)[:20]),
+    ("search + email domain + created in a year, first 20",
+     lambda pb: pb.query().search('Garcia12').email_domain('example.com').created_between(*YEAR).limit(20),
+     lambda pb: [contact for contact in _intersect(pb.search_contacts('Garcia12'), pb.filter_contacts_by_date(*YEAR))
+                 if contact.email_address.lower().endswith('@example.com')][:20]),
+    ("address contains, by name, page 3",
+     lambda pb: pb.query().contains('address', '77 main').order_by('last_name').offset(40).limit(20),
+     lambda pb: sorted((contact for contact in pb.contacts if '77 main' in contact.address.lower()),
+                       key=_name_key)[40:60]),
+]
+
+
+def _time(func, phone_book):
+    began = time.perf_counter()
+    for _ in range(REPEAT):
+        result = func(phone_book)
+        result = result if isinstance(result, list) else result.all()
+    return (time.perf_counter() - began) / REPEAT, result
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else BOOK_SIZE
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage in PhoneBook.STORAGES:
+            path = os.path.join(tmp, 'contacts.db' if storage == 'sqlite' else 'contacts.json')
+            # no result cache, repeated lists would only measure the cache
+            phone_book = PhoneBook(path, storage=storage, history_file=os.devnull, cache_size=0)
+            phone_book.contacts = make_contacts(size)
+            for _, query, lists in CASES:
+                query(phone_book).all()
+                lists(phone_book)
+            print(f"{storage}:")
+            for name, query, lists in CASES:
+                query_seconds, query_result = _time(query, phone_book)
+                lists_seconds, lists_result = _time(lists, phone_book)
+                assert len(query_result) == len(lists_result)
+                print(f"  {name}: query {query_seconds * 1e3:.2f} ms, lists {lists_seconds * 1e3:.2f} ms "
+                      f"({lists_seconds / query_seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark repeated searches and date filters with the query result cache on and off (cache_size=0).
+
+Operators repeat a small set of queries, REPEATS rounds over QUERIES are timed after a first warm-up round
+(which builds the indexes). The update loop shows what keeping the cached results up to date costs.
+
+    python3 -m benchmarks.bench_query_cache [book size]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import BASE_TIME, make_contacts
+from phone_book import PhoneBook
+
+BOOK_SIZE = 100_000
+REPEATS = 20
+UPDATES = 5_000
+QUERIES = ['Smith12', 'Johnson', 'jo.*son', r'^Mar.*a$', r'\(555\)']
+WINDOWS = [(BASE_TIME + datetime.timedelta(days=days), BASE_TIME + datetime.timedelta(days=days + 30))
+           for days in (30, 200, 400)]
+
+
+def run(tmp, size, cache_size):
+    phone_book = PhoneBook(os.path.join(tmp, 'contacts.json'), history_file=os.devnull, cache_size=cache_size)
+    phone_book.contacts = make_contacts(size)
+    timings = {}
+    for query in QUERIES:
+        phone_book.search_contacts(query)
+        began = time.perf_counter()
+        for _ in range(REPEATS):
+            phone_book.search_contacts(query)
+        timings[f'search {query}'] = (time.perf_counter() - began) / REPEATS
+    for start, end in WINDOWS:
+        phone_book.filter_contacts_by_date(start, end)
+        began = time.perf_counter()
+        for _ in range(REPEATS):
+            phone_book.filter_contacts_by_date(start, end)
+        timings[f'dates {start:%Y-%m-%d} +30d'] = (time.perf_counter() - began) / REPEATS
+    contacts = phone_book.contacts[:UPDATES]
+    began = time.perf_counter()
+    for i, contact in enumerate(contacts):
+        phone_book.update_contact(contact, log=False, last_name=f'Johnson{i}')
+    timings['update_contact (per call)'] = (time.perf_counter() - began) / UPDATES
+    return timings, phone_book.cache_stats()
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else BOOK_SIZE
+    with tempfile.TemporaryDirectory() as tmp:
+        uncached, _ = run(tmp, size, 0)
+        cached, stats = run(tmp, size, 256)
+    print(f"{size:,} contacts, {REPEATS} repeats of each query")
+    print(f"{'':>28} {'no cache':>12} {'cache':>12} {'speedup':>9}")
+    for name, seconds in uncached.items():
+        print(f"{name:>28} {seconds * 1e3:>10.3f}ms {cached[name] * 1e3:>10.3f}ms {seconds / cached[name]:>8.1f}x")
+    print(f"cache: {stats}")
+
+
+if __name__ == '__main__':
+    main()
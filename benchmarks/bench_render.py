@@ -0,0 +1,59 @@
+"""
+Benchmark rendering contacts to a null sink: the old print-per-line print_contacts against render.py's
+buffered pages, for a list and for a lazy iterator (PhoneBook.iter_sorted).
+
+    python3 -m benchmarks.bench_render [contacts]
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import make_contacts
+from phone_book import PhoneBook
+import render
+
+CONTACTS = 100_000
+
+
+def print_contacts_per_line(contacts):
+    """utils.print_contacts before render.py, for comparison."""
+    for contact in contacts:
+        print(f"\n---------------------")
+        print(f"Contact ID: {contact.contact_id} ")
+        print(f"Name: {contact.first_name} {contact.last_name}")
+        print(f"Phone: {contact.phone_number}")
+        if contact.email_address:
+            print(f"Email: {contact.email_address}")
+        if contact.address:
+            print(f"Address: {contact.address}")
+        print(f"Created At: {contact.created_at.strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Updated At: {contact.updated_at.strftime('%Y-%m-%d %H:%M:%S')}")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else CONTACTS
+    with tempfile.TemporaryDirectory() as tmp:
+        phone_book = PhoneBook(os.path.join(tmp, 'contacts.json'), history_file=os.devnull)
+        phone_book.contacts = make_contacts(size)
+        contacts = phone_book.sort_contacts()
+        runs = [
+            ('print per line', lambda sink: print_contacts_per_line(contacts)),
+            ('render, list', lambda sink: render.write_contacts(contacts, sink)),
+            ('render, iter_sorted', lambda sink: render.write_contacts(phone_book.iter_sorted(), sink)),
+            ('pager, every page', lambda sink: render.Pager(
+                lambda offset, limit: phone_book.iter_sorted(offset, limit), total=len(phone_book), out=sink,
+                read=lambda prompt: '').run()),
+        ]
+        print(f"rendering {size:,} contacts to {os.devnull}")
+        for name, run in runs:
+            with open(os.devnull, 'w') as sink, contextlib.redirect_stdout(sink):
+                began = time.perf_counter()
+                run(sink)
+                seconds = time.perf_counter() - began
+            print(f"{name:>20}: {seconds:6.2f}s, {size / seconds:>10,.0f} contacts/sec")
+
+
+if __name__ == '__main__':
+    main()
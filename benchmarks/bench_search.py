@@ -0,0 +1,33 @@
+"""Benchmark search_contacts with the trigram index against a full regex scan."""
+import os
+import re
+
+from benchmarks.common import make_contacts, timed
+from phone_book import PhoneBook
+
+SIZES = [10_000, 100_000, 300_000]
+QUERIES = ['Johnson12', 'smith99', 'jen.*tay', '555-0', '^Mar']
+
+
+def scan(phone_book, query):
+    pattern = re.compile(query, re.IGNORECASE)
+    return [c for c in phone_book.contacts if
+            pattern.search(c.first_name) or pattern.search(c.last_name) or pattern.search(c.phone_number)]
+
+
+def main():
+    print(f"{'contacts':>10} {'query':>12} {'hits':>8} {'indexed (ms)':>13} {'scan (ms)':>10}")
+    for n in SIZES:
+        phone_book = PhoneBook(os.devnull, history_file=os.devnull, cache_size=0)
+        phone_book.contacts = make_contacts(n)
+        _, build_seconds = timed(phone_book.search_contacts, 'warm up the index')
+        print(f"{n:>10} {'(build)':>12} {'':>8} {build_seconds * 1e3:>13.1f}")
+        for query in QUERIES:
+            results, indexed_seconds = timed(phone_book.search_contacts, query, repeat=20)
+            expected, scan_seconds = timed(scan, phone_book, query, repeat=3)
+            assert {c.contact_id for c in results} == {c.contact_id for c in expected}
+            print(f"{n:>10} {query:>12} {len(results):>8} {indexed_seconds * 1e3:>13.3f} {scan_seconds * 1e3:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Load test the HTTP server mode: requests/sec and latency percentiles against localhost.
+
+Without --url a server is started in a child process on a generated book. Each client keeps one
+keep-alive connection and sends a mix of lookups, searches, sorted pages and (with --writes) updates.
+
+    python3 -m benchmarks.bench_server [--url http://127.0.0.1:8080] [--clients 50] [--seconds 10] [--writes 0.05]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import urllib.parse
+
+from benchmarks.common import LAST_NAMES, make_contacts
+
+BOOK_SIZE = 50_000
+
+
+def serve(directory, port, ready):
+    import server
+    from phone_book import PhoneBook
+    phone_book = PhoneBook(os.path.join(directory, 'contacts.json'),
+                           journal_file=os.path.join(directory, 'contacts.journal'))
+    phone_book.contacts = make_contacts(BOOK_SIZE)
+    phone_book.update_next_id()
+    instance = server.PhoneBookServer(phone_book, port=port)
+
+    async def main():
+        await instance.start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+async def request(reader, writer, method, path, body=b''):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                 + body)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    headers = dict(line.split(b': ', 1) for line in head.split(b'\r\n')[1:] if b': ' in line)
+    if headers.get(b'Transfer-Encoding') == b'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n'))[:-2], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.readexactly(int(headers.get(b'Content-Length', 0)))
+    return status
+
+
+def next_request(rng, writes, book_size):
+    roll = rng.random()
+    if roll < writes:
+        body = f'{{"address": "{rng.randrange(1000)} Load St"}}'.encode()
+        return 'PATCH', f"/contacts/{rng.randrange(1, book_size + 1)}", body
+    kind = rng.randrange(3)
+    if kind == 0:
+        return 'GET', f"/contacts/{rng.randrange(1, book_size + 1)}", b''
+    if kind == 1:
+        query = urllib.parse.quote(f"{rng.choice(LAST_NAMES)}{rng.randrange(1000)}")
+        return 'GET', f"/search?q={query}", b''
+    return 'GET', f"/contacts?offset={rng.randrange(book_size - 20)}&limit=20", b''
+
+
+async def client(host, port, deadline, writes, seed, latencies, errors):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            method, path, body = next_request(rng, writes, BOOK_SIZE)
+            start = time.perf_counter()
+            status = await request(reader, writer, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def load(host, port, clients, seconds, writes):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, deadline, writes, seed, latencies, errors) for seed in range(clients)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def report(latencies, errors, seconds):
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"{len(latencies):,} requests in {seconds:.1f}s: {len(latencies) / seconds:,.0f} requests/sec, "
+          f"p50 {percentile(0.50):.1f} ms, p99 {percentile(0.99):.1f} ms, {len(errors)} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help="server to test, by default one is started on a generated book")
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--writes', type=float, default=0.05, help="fraction of requests which are updates")
+    args = parser.parse_args()
+
+    process = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            url = urllib.parse.urlsplit(args.url)
+            host, port = url.hostname, url.port
+        else:
+            host, port = '127.0.0.1', 8765
+            ready = multiprocessing.Event()
+            process = multiprocessing.Process(target=serve, args=(tmp, port, ready), daemon=True)
+            process.start()
+            ready.wait()
+        try:
+            report(*asyncio.run(load(host, port, args.clients, args.seconds, args.writes)))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark regex search throughput of ShardedPhoneBook against shard count (queries/sec and speedup).
+
+The queries can't use the trigram index, so every one is a full scan. Scaling is bounded by the number
+of cores: run it on a machine with several and compare the 1 shard line with the others.
+"""
+import os
+import sys
+import time
+
+from benchmarks.common import make_contacts
+from phone_book import PhoneBook
+from sharded_phone_book import ShardedPhoneBook
+
+BOOK_SIZE = 500_000
+QUERIES = [r'^Mar.*a$', r'(\d)\1\1', r'^J.*son[0-9]$', r'Ta?y.*1$']
+ROUNDS = 3
+
+
+def run(phone_book):
+    start = time.perf_counter()
+    hits = 0
+    for _ in range(ROUNDS):
+        for query in QUERIES:
+            hits += len(phone_book.search_contacts(query))
+    return ROUNDS * len(QUERIES) / (time.perf_counter() - start), hits
+
+
+def main():
+    book_size = int(sys.argv[1]) if len(sys.argv) > 1 else BOOK_SIZE
+    contacts = make_contacts(book_size)
+    phone_book = PhoneBook(os.devnull, history_file=os.devnull, cache_size=0)
+    phone_book.contacts = contacts
+    baseline, expected_hits = run(phone_book)
+    print(f"{book_size} contacts, {os.cpu_count()} cores")
+    print(f"{'shards':>8} {'queries/sec':>12} {'speedup':>8}")
+    print(f"{'none':>8} {baseline:>12.2f} {1.0:>8.2f}")
+    shard_counts = sorted({1, 2, 4, os.cpu_count()} | ({8} if os.cpu_count() >= 8 else set()))
+    for shards in shard_counts:
+        with ShardedPhoneBook(os.devnull, shards=shards, history_file=os.devnull, cache_size=0) as sharded:
+            sharded.contacts = contacts
+            rate, hits = run(sharded)
+            assert hits == expected_hits
+            print(f"{shards:>8} {rate:>12.2f} {rate / baseline:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
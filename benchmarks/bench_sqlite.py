@@ -0,0 +1,42 @@
+"""Benchmark the sqlite storage (queries pushed down to SQL) against the in-memory objects storage."""
+import datetime
+import itertools
+import os
+import tempfile
+
+from benchmarks.common import BASE_TIME, make_contacts, timed
+from phone_book import PhoneBook
+
+N = 100_000
+
+
+def main():
+    contacts = make_contacts(N)
+    start_date = BASE_TIME + datetime.timedelta(days=400)
+    end_date = start_date + datetime.timedelta(days=7)
+    with tempfile.TemporaryDirectory() as tmp:
+        memory_book = PhoneBook(os.devnull, history_file=os.devnull)
+        memory_book.contacts = contacts
+        sqlite_book = PhoneBook(os.path.join(tmp, 'contacts.db'), storage='sqlite')
+        _, load_seconds = timed(setattr, sqlite_book, 'contacts', contacts)
+        print(f"{N} contacts, sqlite bulk insert: {load_seconds:.2f}s")
+
+        operations = [
+            ('get_contact_by_id', lambda book: book.get_contact_by_id(N // 2)),
+            ('search substring', lambda book: book.search_contacts('Johnson12')),
+            ('search regex', lambda book: book.search_contacts('^Jen.*9$')),
+            ('filter 7 days', lambda book: book.filter_contacts_by_date(start_date, end_date)),
+            ('first sorted page', lambda book: list(itertools.islice(
+                book._contacts.iter_sorted() if book.storage == 'sqlite' else book.sort_contacts(), 20))),
+        ]
+        print(f"{'operation':>20} {'objects (ms)':>13} {'sqlite (ms)':>12}")
+        for name, operation in operations:
+            # the first call builds the in-memory indexes, time the steady state
+            operation(memory_book)
+            _, memory_seconds = timed(operation, memory_book, repeat=5)
+            _, sqlite_seconds = timed(operation, sqlite_book, repeat=5)
+            print(f"{name:>20} {memory_seconds * 1e3:>13.3f} {sqlite_seconds * 1e3:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
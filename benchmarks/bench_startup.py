@@ -0,0 +1,35 @@
+"""Benchmark load_contacts startup time for the JSON file and the lazy binary snapshot."""
+import os
+import tempfile
+import time
+
+from benchmarks.common import make_contacts, timed
+from phone_book import PhoneBook
+
+SIZES = [10_000, 100_000, 300_000]
+
+
+def main():
+    print(f"{'contacts':>10} {'format':>8} {'size (MB)':>10} {'load (ms)':>10} {'first lookup (ms)':>18} "
+          f"{'touch all (ms)':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in SIZES:
+            contacts = make_contacts(n)
+            for name in ('contacts.json', 'contacts.pbsnap'):
+                path = os.path.join(tmp, name)
+                phone_book = PhoneBook(path)
+                phone_book.contacts = contacts
+                phone_book.save_contacts()
+
+                phone_book = PhoneBook(path)
+                _, load_seconds = timed(phone_book.load_contacts)
+                start = time.perf_counter()
+                phone_book.get_contact_by_id(n // 2)
+                lookup_seconds = time.perf_counter() - start
+                _, touch_seconds = timed(lambda: [c.last_name for c in phone_book.contacts])
+                print(f"{n:>10} {os.path.splitext(name)[1][1:]:>8} {os.path.getsize(path) / 1e6:>10.1f} "
+                      f"{load_seconds * 1e3:>10.1f} {lookup_seconds * 1e3:>18.3f} {touch_seconds * 1e3:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
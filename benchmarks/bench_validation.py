@@ -0,0 +1,44 @@
+"""Micro-benchmark per-row validation cost: pattern strings per call (old), compiled validators, validate_many."""
+import re
+
+from benchmarks.common import contact_rows, timed
+import utils
+
+N = 200_000
+
+
+def old_validate(phone_number, email):
+    """The validators as they were: re.match with a pattern string on every call."""
+    if not re.match(r'^\(\d{3}\) \d{3}-\d{4}$', phone_number):
+        return False
+    return not email or bool(re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', email))
+
+
+def compiled_validate(phone_number, email):
+    try:
+        utils.validate_phone_number(phone_number)
+        if email:
+            utils.validate_email(email)
+        return True
+    except ValueError:
+        return False
+
+
+def main():
+    rows = list(contact_rows(N, invalid_every=10))
+    phone_numbers = [row['phone_number'] for row in rows]
+    emails = [row['email_address'] for row in rows]
+
+    old, old_seconds = timed(lambda: [old_validate(p, e) for p, e in zip(phone_numbers, emails)])
+    compiled, compiled_seconds = timed(lambda: [compiled_validate(p, e) for p, e in zip(phone_numbers, emails)])
+    masks, bulk_seconds = timed(utils.validate_many, phone_numbers, emails)
+    assert old == compiled == [mask == 0 for mask in masks]
+
+    print(f"{N} rows, {masks.count(0)} valid")
+    print(f"{'pattern string per call':>24}: {old_seconds / N * 1e9:8.0f} ns/row")
+    print(f"{'compiled validators':>24}: {compiled_seconds / N * 1e9:8.0f} ns/row")
+    print(f"{'validate_many':>24}: {bulk_seconds / N * 1e9:8.0f} ns/row")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Benchmark the incrementally maintained sorted/grouped views against re-sorting and regrouping on every request."""
+import os
+
+from benchmarks.common import make_contacts, timed
+from phone_book import PhoneBook
+
+SIZES = [10_000, 100_000, 300_000]
+
+
+def full_sort(phone_book):
+    return sorted(phone_book.contacts, key=lambda x: x.last_name)
+
+
+def full_group(phone_book):
+    groups = {}
+    for contact in phone_book.contacts:
+        groups.setdefault(contact.last_name[0].upper(), []).append(contact)
+    return groups
+
+
+def main():
+    print(f"{'contacts':>10} {'page (ms)':>10} {'re-sort (ms)':>13} {'group page (ms)':>16} {'regroup (ms)':>13} "
+          f"{'update (us)':>12}")
+    for n in SIZES:
+        phone_book = PhoneBook(os.devnull, history_file=os.devnull)
+        phone_book.contacts = make_contacts(n)
+        phone_book.sorted_page(1)
+        _, page_seconds = timed(phone_book.sorted_page, n // 40, repeat=100)
+        _, sort_seconds = timed(full_sort, phone_book, repeat=3)
+        _, group_page_seconds = timed(phone_book.sorted_page, 2, initial='S', repeat=100)
+        _, group_seconds = timed(full_group, phone_book, repeat=3)
+        contact = phone_book.get_contact_by_id(n // 2)
+        _, update_seconds = timed(lambda: phone_book.update_contact(contact, last_name=contact.last_name[::-1]),
+                                  repeat=200)
+        print(f"{n:>10} {page_seconds * 1e3:>10.3f} {sort_seconds * 1e3:>13.1f} {group_page_seconds * 1e3:>16.3f} "
+              f"{group_seconds * 1e3:>13.1f} {update_seconds * 1e6:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Shared helpers for the benchmark scripts, run them from the project root: python3 -m benchmarks.<name>"""
+import csv
+import datetime
+import json
+import logging
+import random
+import time
+
+from contact import Contact
+
+# benchmarks shouldn't flood logs/phone_book.log
+logging.disable(logging.CRITICAL)
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David', 'Sarah']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Wilson', 'Taylor']
+BASE_TIME = datetime.datetime(2020, 1, 1)
+CSV_FIELDS = ['id', 'first_name', 'last_name', 'phone_number', 'email_address', 'address', 'created_at', 'updated_at']
+
+
+def contact_rows(n, seed=42, invalid_every=0):
+    """
+    Yield n contact rows as dicts with the CSV columns, ids 1..n, deterministic for a given seed.
+
+    With invalid_every=k every k-th row is broken, in turn: a malformed phone number,
+    a malformed email address, an empty first name.
+    """
+    rng = random.Random(seed)
+    for contact_id in range(1, n + 1):
+        created_at = BASE_TIME + datetime.timedelta(seconds=rng.randrange(0, 4 * 365 * 24 * 3600))
+        row = {
+            'id': contact_id,
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES) + str(contact_id % 1000),
+            'phone_number': f"({rng.randrange(200, 1000)}) {rng.randrange(200, 1000)}-{contact_id % 10000:04d}",
+            'email_address': f"user{contact_id}@example.com",
+            'address': f"{contact_id} Main St",
+            'created_at': created_at,
+            'updated_at': created_at,
+        }
+        if invalid_every and contact_id % invalid_every == 0:
+            kind = contact_id // invalid_every % 3
+            if kind == 0:
+                row['phone_number'] = row['phone_number'][:-2]
+            elif kind == 1:
+                row['email_address'] = f"user{contact_id}@example"
+            else:
+                row['first_name'] = ''
+        yield row
+
+
+def make_contacts(n, seed=42):
+    """Build n valid contacts with ids 1..n, deterministic for a given seed."""
+    return [Contact(
+        contact_id=row['id'],
+        first_name=row['first_name'],
+        last_name=row['last_name'],
+        phone_number=row['phone_number'],
+        email_address=row['email_address'],
+        address=row['address'],
+        created_at=row['created_at'],
+        updated_at=row['updated_at'],
+    ) for row in contact_rows(n, seed)]
+
+
+def write_csv(path, n, seed=42, invalid_every=0):
+    """Write n rows in the test_data/fake_data.csv layout."""
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for row in contact_rows(n, seed, invalid_every):
+            row['created_at'] = row['created_at'].isoformat()
+            row['updated_at'] = row['updated_at'].isoformat()
+            writer.writerow(row)
+
+
+def write_json(path, n, seed=42, invalid_every=0):
+    """
+    Write n contacts in the data/contacts.json layout, streamed so 10M contacts don't need to fit in memory.
+
+    load_contacts refuses a file with invalid contacts, invalid_every is for testing exactly that.
+    """
+    with open(path, 'w') as file:
+        file.write('[')
+        for i, row in enumerate(contact_rows(n, seed, invalid_every)):
+            row['created_at'] = row['created_at'].isoformat()
+            row['updated_at'] = row['updated_at'].isoformat()
+            file.write((',\n' if i else '\n') + json.dumps(row))
+        file.write('\n]\n')
+
+
+def timed(func, *args, repeat=1, **kwargs):
+    """Run func repeat times and return (last result, average seconds per call)."""
+    result = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) / repeat
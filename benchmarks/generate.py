@@ -0,0 +1,37 @@
+"""
+Generate synthetic contacts for testing and benchmarking, deterministic for a given seed.
+
+    python3 -m benchmarks.generate 1000000 data/contacts_1m.csv --invalid-every 20
+    python3 -m benchmarks.generate 100000 data/contacts_100k.json
+
+The format follows the file extension: .csv in the test_data/fake_data.csv layout (for batch import),
+.json in the data/contacts.json layout (for load_contacts). Files are written as they are generated,
+so 10M contacts don't need to fit in memory.
+"""
+import argparse
+import time
+
+from benchmarks.common import write_csv, write_json
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic contacts as CSV or JSON.")
+    parser.add_argument('rows', type=int, help="number of contacts")
+    parser.add_argument('path', help="output file, .csv or .json")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--invalid-every', type=int, default=0,
+                        help="make every k-th contact invalid (bad phone, bad email or empty first name in turn)")
+    args = parser.parse_args(argv)
+    if args.path.endswith('.csv'):
+        write = write_csv
+    elif args.path.endswith('.json'):
+        write = write_json
+    else:
+        parser.error("the output file must end with .csv or .json")
+    start = time.perf_counter()
+    write(args.path, args.rows, seed=args.seed, invalid_every=args.invalid_every)
+    print(f"Wrote {args.rows} contacts to {args.path} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark runner: times the PhoneBook operations across book sizes and writes the results as JSON.
+
+    python3 -m benchmarks.run --sizes 10000,100000,1000000 --output results.json
+    python3 -m benchmarks.run --sizes 10000,100000 --compare results.json
+
+Every size gets freshly generated files (benchmarks/common.py, same seed every run) in a temp directory:
+a valid contacts.json for load_contacts and a CSV with 1 in 20 invalid rows for batch_import.
+'cold' operations include building the index they use, the others are averaged over --repeat calls.
+With --compare, operations slower than the baseline by more than --tolerance are reported as regressions
+and the exit status is 1.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import BASE_TIME, write_csv, write_json
+from phone_book import PhoneBook
+
+DEFAULT_SIZES = [10_000, 100_000]
+LOOKUPS = 10_000
+SEARCHES = {'search_indexed': 'Johnson12', 'search_regex': r'^Mar.*a$'}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(results, size, operation, func, repeat=1, items=1):
+    """Time func (average over repeat calls) and record it, items is how many things one call processes."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    seconds = (time.perf_counter() - start) / repeat
+    results.append({'operation': operation, 'size': size, 'seconds': seconds,
+                    'items_per_sec': items / seconds if seconds else None})
+    print(f"{size:>10} {operation:>22} {seconds * 1e3:>12.3f} ms", file=sys.stderr)
+
+
+def run_size(size, storage, repeat, tmp):
+    results = []
+    json_path = os.path.join(tmp, f'contacts_{size}.json')
+    csv_path = os.path.join(tmp, f'contacts_{size}.csv')
+    write_json(json_path, size)
+    write_csv(csv_path, size, invalid_every=20)
+
+    def new_book(name):
+        path = os.path.join(tmp, name + ('.db' if storage == 'sqlite' else '.json'))
+        # no result cache: repeated searches and date filters would time cache hits, not the operation
+        return PhoneBook(path, storage=storage, history_file=os.path.join(tmp, name + '.history'), cache_size=0)
+
+    phone_book = new_book(f'book_{size}')
+    if storage == 'sqlite':
+        def load():
+            source = PhoneBook(json_path, history_file=os.devnull)
+            source.load_contacts()
+            phone_book.contacts = source.contacts
+    else:
+        def load():
+            phone_book.contacts_file = json_path
+            phone_book.load_contacts()
+            phone_book.contacts_file = os.path.join(tmp, f'book_{size}.json')
+    measure(results, size, 'load_contacts', load, items=size)
+    measure(results, size, 'save_contacts', phone_book.save_contacts, items=size)
+
+    rng = random.Random(size)
+    ids = [rng.randrange(1, size + 1) for _ in range(LOOKUPS)]
+    measure(results, size, 'get_contact_by_id', lambda: [phone_book.get_contact_by_id(i) for i in ids],
+            repeat=repeat, items=LOOKUPS)
+
+    measure(results, size, 'search_cold', lambda: phone_book.search_contacts('Smith7'))
+    for operation, query in SEARCHES.items():
+        measure(results, size, operation, lambda: phone_book.search_contacts(query), repeat=repeat)
+
+    start, end = BASE_TIME + datetime.timedelta(days=400), BASE_TIME + datetime.timedelta(days=430)
+    measure(results, size, 'filter_by_date_cold', lambda: phone_book.filter_contacts_by_date(start, end))
+    measure(results, size, 'filter_contacts_by_date', lambda: phone_book.filter_contacts_by_date(start, end),
+            repeat=repeat)
+
+    measure(results, size, 'sort_contacts_cold', phone_book.sort_contacts, items=size)
+    measure(results, size, 'sort_contacts', phone_book.sort_contacts, repeat=repeat, items=size)
+    measure(results, size, 'group_contacts', phone_book.group_contacts, repeat=repeat, items=size)
+
+    importing = new_book(f'import_{size}')
+    measure(results, size, 'batch_import',
+            lambda: importing.batch_import(csv_path, workers=1, error_file=os.path.join(tmp, 'rejects.csv')),
+            items=size)
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    """Print the change against a baseline results file, returns the regressions."""
+    with open(baseline_path) as file:
+        baseline = {(entry['operation'], entry['size']): entry['seconds'] for entry in json.load(file)['results']}
+    regressions = []
+    print(f"\n{'size':>10} {'operation':>22} {'baseline ms':>12} {'now ms':>12} {'change':>8}")
+    for entry in results:
+        before = baseline.get((entry['operation'], entry['size']))
+        if not before:
+            continue
+        ratio = entry['seconds'] / before
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(entry)
+            flag = '  REGRESSION'
+        print(f"{entry['size']:>10} {entry['operation']:>22} {before * 1e3:>12.3f} {entry['seconds'] * 1e3:>12.3f} "
+              f"{ratio:>7.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time PhoneBook operations across book sizes.")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="comma separated book sizes, e.g. 10000,100000,1000000,10000000")
+    parser.add_argument('--storage', choices=PhoneBook.STORAGES, default='objects')
+    parser.add_argument('--repeat', type=int, default=3, help="calls to average for the warm operations")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the JSON results")
+    parser.add_argument('--compare', help="a previous results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="slowdown against the baseline reported as a regression (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(size) for size in args.sizes.split(',')):
+            results.extend(run_size(size, args.storage, args.repeat, tmp))
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'storage': args.storage,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
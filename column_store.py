@@ -0,0 +1,170 @@
+"""
+Column-oriented contact storage for PhoneBook(storage='columns').
+
+Contacts live in parallel arrays (one per field) instead of one object each; reading a contact
+returns a ContactView, a lightweight Contact which reads and writes straight through to the columns.
+"""
+import sys
+from array import array
+from collections.abc import MutableMapping
+
+from contact import Contact
+
+STRING_COLUMNS = ('first_name', 'last_name', 'phone_number', 'email_address', 'address')
+
+
+class ContactView(Contact):
+    """A Contact backed by a row of a ColumnStore, with the same attribute API."""
+
+    __slots__ = ('_store', '_id')
+
+    def __init__(self, store, contact_id):
+        self._store = store
+        self._id = contact_id
+
+    def _row(self):
+        return self._store.rows[self._id]
+
+    @property
+    def contact_id(self):
+        return self._id
+
+    @contact_id.setter
+    def contact_id(self, value):
+        self._store.rename(self._id, value)
+        self._id = value
+
+    def __eq__(self, other):
+        return isinstance(other, ContactView) and other._store is self._store and other._id == self._id
+
+    def __hash__(self):
+        return hash((id(self._store), self._id))
+
+
+def _column_property(name):
+    def getter(self):
+        return self._store.columns[name][self._row()]
+
+    def setter(self, value):
+        self._store.columns[name][self._row()] = value
+
+    return property(getter, setter)
+
+
+def _time_property(name):
+    def getter(self):
+        return getattr(self._store, name)[self._row()]
+
+    def setter(self, value):
+        getattr(self._store, name)[self._row()] = value
+
+    return property(getter, setter)
+
+
+for _name in STRING_COLUMNS:
+    setattr(ContactView, _name, _column_property(_name))
+ContactView._created_at = _time_property('created_at')
+ContactView._updated_at = _time_property('updated_at')
+
+
+class ColumnStore(MutableMapping):
+    """id -> contact mapping over parallel arrays; deleting a row moves the last row into its place."""
+
+    def __init__(self, contacts=()):
+        self.ids = array('q')
+        self.rows = {}
+        self.columns = {name: [] for name in STRING_COLUMNS}
+        self.created_at = array('q')
+        self.updated_at = array('q')
+        for contact in contacts:
+            self[contact.contact_id] = contact
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, contact_id):
+        return contact_id in self.rows
+
+    def __getitem__(self, contact_id):
+        if contact_id not in self.rows:
+            raise KeyError(contact_id)
+        return ContactView(self, contact_id)
+
+    def __setitem__(self, contact_id, contact):
+        if isinstance(contact, ContactView) and contact._store is self and contact._id == contact_id:
+            return
+        values = [getattr(contact, name) for name in STRING_COLUMNS]
+        # intern the short, highly repeated columns once more, values coming from views may not be
+        values[0] = sys.intern(values[0])
+        values[1] = sys.intern(values[1])
+        row = self.rows.get(contact_id)
+        if row is None:
+            row = self.rows[contact_id] = len(self.ids)
+            self.ids.append(contact_id)
+            for name, value in zip(STRING_COLUMNS, values):
+                self.columns[name].append(value)
+            self.created_at.append(contact._created_at)
+            self.updated_at.append(contact._updated_at)
+        else:
+            for name, value in zip(STRING_COLUMNS, values):
+                self.columns[name][row] = value
+            self.created_at[row] = contact._created_at
+            self.updated_at[row] = contact._updated_at
+
+    def __delitem__(self, contact_id):
+        row = self.rows.pop(contact_id)
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self.ids[row] = moved_id
+            for column in self.columns.values():
+                column[row] = column[last]
+            self.created_at[row] = self.created_at[last]
+            self.updated_at[row] = self.updated_at[last]
+            self.rows[moved_id] = row
+        self.ids.pop()
+        for column in self.columns.values():
+            column.pop()
+        self.created_at.pop()
+        self.updated_at.pop()
+
+    _missing = object()
+
+    def pop(self, contact_id, default=_missing):
+        """Remove a contact and return it as a standalone Contact (a view would point at a deleted row)."""
+        if contact_id not in self.rows:
+            if default is self._missing:
+                raise KeyError(contact_id)
+            return default
+        contact = self.detach(contact_id)
+        del self[contact_id]
+        return contact
+
+    def detach(self, contact_id):
+        """Copy a row out into a regular Contact."""
+        row = self.rows[contact_id]
+        return Contact.from_compact(contact_id, *(self.columns[name][row] for name in STRING_COLUMNS),
+                                    self.created_at[row], self.updated_at[row])
+
+    def copy(self):
+        """A standalone copy of the store, made of whole array/list copies (e.g. for a background save)."""
+        store = ColumnStore.__new__(ColumnStore)
+        store.ids = self.ids[:]
+        store.rows = self.rows.copy()
+        store.columns = {name: column[:] for name, column in self.columns.items()}
+        store.created_at = self.created_at[:]
+        store.updated_at = self.updated_at[:]
+        return store
+
+    def rename(self, old_id, new_id):
+        """Give a row another contact id."""
+        if new_id == old_id:
+            return
+        if new_id in self.rows:
+            raise ValueError(f"Contact ID {new_id} already exists")
+        row = self.rows.pop(old_id)
+        self.rows[new_id] = row
+        self.ids[row] = new_id
@@ -1,39 +1,79 @@
 import datetime
+import sys
+
 import utils
-import logging
+import log_pipeline
+import metrics
+
+logger = log_pipeline.get_logger('update')
 
 
 class Contact:
     """A class to represent a contact object in the phone book."""
 
+    # no per-instance __dict__ and timestamps are epoch microseconds;
+    # the change history is kept by the phone book's history store (see history_store.py), not on the contact
+    __slots__ = ('contact_id', 'first_name', 'last_name', 'phone_number', 'email_address', 'address',
+                 '_created_at', '_updated_at')
+
     def __init__(self, contact_id: int, first_name, last_name, phone_number, email_address=None, address=None,
-                 created_at=None, updated_at=None, history=None):
+                 created_at=None, updated_at=None, validate=True):
         self.contact_id = contact_id
-        self.first_name = first_name
-        self.last_name = last_name
-        self.phone_number = utils.validate_phone_number(phone_number)
-        self.email_address = utils.validate_email(email_address) if email_address else None
+        # names repeat a lot across a phone book, share one string object per distinct name
+        self.first_name = sys.intern(first_name)
+        self.last_name = sys.intern(last_name)
+        # validate=False is for fields which have already been validated in bulk (e.g. batch import)
+        if validate:
+            phone_number = utils.validate_phone_number(phone_number)
+            email_address = utils.validate_email(email_address) if email_address else None
+        self.phone_number = phone_number
+        self.email_address = email_address or None
         self.address = address
         self.created_at = created_at if created_at else utils.get_current_time()
         self.updated_at = updated_at if updated_at else utils.get_current_time()
-        self.history = history if history else []
+
+    @property
+    def created_at(self):
+        return utils.from_epoch_us(self._created_at)
+
+    @created_at.setter
+    def created_at(self, value):
+        self._created_at = utils.to_epoch_us(value)
+
+    @property
+    def updated_at(self):
+        return utils.from_epoch_us(self._updated_at)
+
+    @updated_at.setter
+    def updated_at(self, value):
+        self._updated_at = utils.to_epoch_us(value)
+
+    @property
+    def phone_key(self):
+        """The phone number as a 10 digit int, see utils.phone_key."""
+        return utils.phone_key(self.phone_number)
 
     def update(self, **kwargs):
-        """Update contact details and history changes."""
-        for key, value in kwargs.items():
+        """Update contact details, returns the changes as (field, old value, new value) tuples."""
+        return self.apply_changes(kwargs, utils.get_current_time())
+
+    def apply_changes(self, changes, timestamp, log=True):
+        """
+        Apply field changes which all happened at timestamp (also used to replay the journal).
+
+        Returns the changes as (field, old value, new value) tuples, for the history store.
+        """
+        applied = []
+        for key, value in changes.items():
             if hasattr(self, key):
                 old_value = getattr(self, key)
                 setattr(self, key, value)
-                change_record = {
-                    'timestamp': utils.get_current_time(),
-                    'field': key,
-                    'old_value': old_value,
-                    'new_value': value
-                }
-                self.history.append(change_record)
-                self.updated_at = utils.get_current_time()
-                logging.info(
-                    f"Updated contact {self.first_name} {self.last_name}: {key} changed from {old_value} to {value}")
+                applied.append((key, old_value, value))
+                self.updated_at = timestamp
+                if log:
+                    logger.info("Updated contact %s %s: %s changed from %s to %s",
+                                self.first_name, self.last_name, key, old_value, value)
+        return applied
 
     def to_dict(self):
         """Convert the contact object to a dictionary for JSON serialization."""
@@ -45,15 +85,34 @@ class Contact:
             'email_address': self.email_address,
             'address': self.address,
             'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'history': self.history
+            'updated_at': self.updated_at
         }
 
     def __str__(self):
         return f"Contact {self.first_name} {self.last_name} {self.phone_number} {self.email_address} {self.address}"
 
+    def copy(self):
+        """A standalone Contact with the same fields (also of a view, see column_store.py)."""
+        return Contact.from_compact(self.contact_id, self.first_name, self.last_name, self.phone_number,
+                                    self.email_address, self.address, self._created_at, self._updated_at)
+
     @classmethod
-    def from_dict(cls, data):
+    def from_compact(cls, contact_id, first_name, last_name, phone_number, email_address, address,
+                     created_at: int, updated_at: int):
+        """Rebuild an already-validated contact from its compact fields (epoch timestamps)."""
+        contact = cls.__new__(cls)
+        contact.contact_id = contact_id
+        contact.first_name = sys.intern(first_name)
+        contact.last_name = sys.intern(last_name)
+        contact.phone_number = phone_number
+        contact.email_address = email_address
+        contact.address = address
+        contact._created_at = created_at
+        contact._updated_at = updated_at
+        return contact
+
+    @classmethod
+    def from_dict(cls, data, validate=True):
         """Create a Contact object from a dictionary."""
         return cls(
             contact_id=int(data.get('id')),
@@ -64,5 +123,9 @@ class Contact:
             address=data.get('address'),
             created_at=datetime.datetime.fromisoformat(data.get('created_at')),
             updated_at=datetime.datetime.fromisoformat(data.get('updated_at')),
-            history=data.get('history', [])
+            validate=validate
         )
+
+
+# timed when metrics are enabled, a rejected phone number or email counts against its validation rule
+metrics.register(Contact, {'__init__': 'contact_create', 'apply_changes': 'contact_change'})
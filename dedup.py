@@ -0,0 +1,182 @@
+"""
+Duplicate contact detection without comparing every pair of contacts.
+
+1. exact matches: hash maps on the normalized phone number (digits only), email (lower case) and full name
+2. fuzzy name matches: contacts are put in blocks by (soundex of the last name, first initial); inside a block
+   names are kept sorted and each one is only compared with difflib to its WINDOW nearest neighbours
+   (sorted neighbourhood), so the work stays linear even when a block gets big
+"""
+import bisect
+import difflib
+import functools
+import re
+
+# import-time modes of PhoneBook.batch_import(dedup_mode=...)
+DEDUP_MODES = ('skip', 'merge', 'flag')
+DEFAULT_NAME_THRESHOLD = 0.9
+WINDOW = 4
+
+NON_DIGITS = re.compile(r'\D')
+SOUNDEX_CODES = {letter: digit for digit, letters in
+                 (('1', 'bfpv'), ('2', 'cgjkqsxz'), ('3', 'dt'), ('4', 'l'), ('5', 'mn'), ('6', 'r'))
+                 for letter in letters}
+
+
+def normalize_phone(phone_number):
+    if not phone_number:
+        return None
+    return NON_DIGITS.sub('', phone_number) or None
+
+
+def normalize_email(email_address):
+    return email_address.strip().lower() if email_address else None
+
+
+def normalize_name(first_name, last_name):
+    return f"{first_name.strip().lower()} {last_name.strip().lower()}"
+
+
+@functools.lru_cache(maxsize=65536)
+def soundex(name):
+    """American soundex code of a name, e.g. Robert -> R163."""
+    letters = [char for char in name.lower() if 'a' <= char <= 'z']
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    last = SOUNDEX_CODES.get(letters[0])
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter)
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w don't separate two letters with the same code, vowels do
+        if letter not in 'hw':
+            last = digit
+    return code.ljust(4, '0')
+
+
+def blocking_key(first_name, last_name):
+    return soundex(last_name), first_name.strip()[:1].lower()
+
+
+def similar_names(name, others, threshold=DEFAULT_NAME_THRESHOLD):
+    """Yield the (other name, contact id) pairs of others which are similar enough to name."""
+    matcher = difflib.SequenceMatcher(None)
+    # the matcher caches what it knows about its second sequence, so name goes there once
+    matcher.set_seq2(name)
+    for other, contact_id in others:
+        matcher.set_seq1(other)
+        # the cheap upper bounds first, most neighbours are rejected by them
+        if matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold \
+                and matcher.ratio() >= threshold:
+            yield other, contact_id
+
+
+class DuplicateFinder:
+    """Incremental duplicate lookup: add contacts, then ask which known contact a new one duplicates."""
+
+    def __init__(self, contacts=(), name_threshold=DEFAULT_NAME_THRESHOLD):
+        self.name_threshold = name_threshold
+        self.phones = {}
+        self.emails = {}
+        self.names = {}
+        # blocking key -> sorted [(normalized name, contact id)]
+        self.blocks = {}
+        for contact in contacts:
+            self.add(contact.contact_id, contact.first_name, contact.last_name, contact.phone_number,
+                     contact.email_address)
+
+    def add(self, contact_id, first_name, last_name, phone_number, email_address):
+        phone = normalize_phone(phone_number)
+        if phone:
+            self.phones.setdefault(phone, contact_id)
+        email = normalize_email(email_address)
+        if email:
+            self.emails.setdefault(email, contact_id)
+        name = normalize_name(first_name, last_name)
+        if name not in self.names:
+            self.names[name] = contact_id
+            bisect.insort(self.blocks.setdefault(blocking_key(first_name, last_name), []), (name, contact_id))
+
+    def match(self, first_name, last_name, phone_number, email_address):
+        """(id of the contact this one duplicates, reason) or None."""
+        phone = normalize_phone(phone_number)
+        if phone in self.phones:
+            return self.phones[phone], 'phone'
+        email = normalize_email(email_address)
+        if email in self.emails:
+            return self.emails[email], 'email'
+        name = normalize_name(first_name, last_name)
+        if name in self.names:
+            return self.names[name], 'name'
+        block = self.blocks.get(blocking_key(first_name, last_name), [])
+        i = bisect.bisect_left(block, (name,))
+        for _, contact_id in similar_names(name, block[max(0, i - WINDOW):i + WINDOW], self.name_threshold):
+            return contact_id, 'name'
+        return None
+
+
+class _UnionFind:
+
+    def __init__(self):
+        self.parents = {}
+
+    def find(self, item):
+        root = self.parents.setdefault(item, item)
+        while self.parents[root] != root:
+            root = self.parents[root]
+        # path compression
+        while item != root:
+            self.parents[item], item = root, self.parents[item]
+        return root
+
+    def union(self, item, other):
+        root, other_root = self.find(item), self.find(other)
+        if root != other_root:
+            self.parents[max(root, other_root)] = min(root, other_root)
+
+
+def find_duplicates(contacts, name_threshold=DEFAULT_NAME_THRESHOLD):
+    """
+    Report every group of duplicate contacts in one pass over contacts.
+
+    Returns a list of (contact ids, reasons) pairs, one per group of two or more contacts,
+    where reasons is the sorted list of what matched: 'phone', 'email' and/or 'name'.
+    """
+    groups = _UnionFind()
+    reasons = {}
+    first_by_key = {}
+    blocks = {}
+
+    def link(contact_id, other_id, reason):
+        groups.union(contact_id, other_id)
+        reasons.setdefault(contact_id, set()).add(reason)
+        reasons.setdefault(other_id, set()).add(reason)
+
+    for contact in contacts:
+        contact_id = contact.contact_id
+        name = normalize_name(contact.first_name, contact.last_name)
+        for reason, key in (('phone', normalize_phone(contact.phone_number)),
+                            ('email', normalize_email(contact.email_address)),
+                            ('name', name)):
+            if key:
+                other_id = first_by_key.setdefault((reason, key), contact_id)
+                if other_id != contact_id:
+                    link(contact_id, other_id, reason)
+                elif reason == 'name':
+                    # one entry per distinct name is enough for the fuzzy pass
+                    blocks.setdefault(blocking_key(contact.first_name, contact.last_name), []).append(
+                        (name, contact_id))
+
+    for block in blocks.values():
+        block.sort()
+        for i, (name, contact_id) in enumerate(block):
+            for _, other_id in similar_names(name, block[i + 1:i + 1 + WINDOW], name_threshold):
+                link(contact_id, other_id, 'name')
+
+    members = {}
+    for contact_id in reasons:
+        members.setdefault(groups.find(contact_id), []).append(contact_id)
+    return [(sorted(ids), sorted(set().union(*(reasons[contact_id] for contact_id in ids))))
+            for _, ids in sorted(members.items())]
@@ -0,0 +1,117 @@
+"""
+Streaming export used by PhoneBook.export_contacts, the other way round from importer.py.
+
+Contacts are read from a lazy iterator and written row by row, so memory doesn't grow with the book.
+CSV uses the columns of test_data/fake_data.csv (the file can be imported again, .gz too), NDJSON has one JSON object
+per line; a path ending with .gz is gzip-compressed. The file is written next to the target and renamed
+once complete, like save_contacts.
+"""
+import csv
+import gzip
+import json
+import os
+import time
+
+FORMATS = ('csv', 'ndjson')
+# the header of test_data/fake_data.csv
+EXPORT_FIELDS = ('id', 'first_name', 'last_name', 'phone_number', 'email_address', 'address', 'created_at',
+                 'updated_at')
+# rows are handed to the file in batches, one write call per batch
+WRITE_BATCH = 1_000
+
+
+class ExportReport:
+    """Summary of one export."""
+
+    def __init__(self, path, export_format):
+        self.path = path
+        self.format = export_format
+        self.rows = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"Exported {self.rows} contacts to {self.path} ({self.format}) in {self.seconds:.2f}s, "
+                f"{self.rows_per_sec:,.0f} rows/sec")
+
+
+def format_of(path):
+    """'csv' or 'ndjson' from the file name (.csv, .ndjson or .jsonl, optionally followed by .gz)."""
+    name = path[:-3] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    raise ValueError(f"Cannot tell the export format of {path}, expected .csv or .ndjson (optionally .gz)")
+
+
+def check_fields(fields):
+    fields = tuple(fields) if fields else EXPORT_FIELDS
+    unknown = [field for field in fields if field not in EXPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"Cannot export the fields {unknown}, expected some of {EXPORT_FIELDS}")
+    return fields
+
+
+def iter_rows(contacts, fields=EXPORT_FIELDS):
+    """Lazily yield one tuple of export values per contact, timestamps in ISO format."""
+    getters = []
+    for field in fields:
+        if field == 'id':
+            getters.append(lambda contact: contact.contact_id)
+        elif field in ('created_at', 'updated_at'):
+            getters.append(lambda contact, field=field: getattr(contact, field).isoformat())
+        else:
+            getters.append(lambda contact, field=field: getattr(contact, field))
+    for contact in contacts:
+        yield tuple(get(contact) for get in getters)
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= WRITE_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_export(contacts, path, fields=None, export_format=None):
+    """Write contacts (any iterable, read once) to path. Returns an ExportReport."""
+    fields = check_fields(fields)
+    export_format = export_format or format_of(path)
+    if export_format not in FORMATS:
+        raise ValueError(f"Unknown export format {export_format}, expected one of {FORMATS}")
+    report = ExportReport(path, export_format)
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_file = path + '.tmp'
+    # compresslevel 6 (gzip's own default) is several times faster than Python's 9 for a few % more bytes
+    file = (gzip.open(temp_file, 'wt', newline='', encoding='utf-8', compresslevel=6) if path.endswith('.gz')
+            else open(temp_file, 'w', newline='', encoding='utf-8'))
+    try:
+        with file:
+            if export_format == 'csv':
+                writer = csv.writer(file)
+                writer.writerow(fields)
+                for batch in _batches(iter_rows(contacts, fields)):
+                    writer.writerows(batch)
+                    report.rows += len(batch)
+            else:
+                encode = json.JSONEncoder(ensure_ascii=False).encode
+                for batch in _batches(iter_rows(contacts, fields)):
+                    file.write(''.join(encode(dict(zip(fields, row))) + '\n' for row in batch))
+                    report.rows += len(batch)
+        os.replace(temp_file, path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    report.seconds = time.perf_counter() - start
+    return report
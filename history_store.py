@@ -0,0 +1,229 @@
+"""
+Change history of the contacts, kept outside of the contacts file.
+
+One append-only file for the whole book, one line per update of a contact:
+
+    <contact id> TAB <timestamp> TAB <changes as JSON>
+
+- the timestamp (epoch microseconds) is written as '+<delta>' from the contact's previous line
+  when the store knows it, absolute otherwise
+- changes are [field, new value] pairs, field is its index in FIELDS when it has one (dictionary coding),
+  the old value is only written ([field, new, old]) when it isn't the field's previous new value
+- a '-' instead of the timestamp marks a deleted contact, its earlier lines are dropped
+
+Nothing is read when the book is loaded. The first history lookup scans the file once for the line offsets
+of every contact, after that only the lines of the requested contact are read.
+Retention (last max_changes changes and/or changes younger than max_age) is applied on read, and on disk
+by compact(), which rewrites the file once compact_every lines have been appended.
+"""
+import json
+import os
+import sys
+import threading
+from array import array
+
+import log_pipeline
+import utils
+
+logger = log_pipeline.get_logger('history')
+
+HISTORY_KEYS = ('timestamp', 'field', 'old_value', 'new_value')
+FIELDS = ('first_name', 'last_name', 'phone_number', 'email_address', 'address')
+FIELD_CODES = {field: code for code, field in enumerate(FIELDS)}
+DELETED = '-'
+DEFAULT_COMPACT_EVERY = 10_000
+
+
+def _decode_field(field):
+    return FIELDS[field] if isinstance(field, int) else sys.intern(field)
+
+
+class HistoryStore:
+
+    def __init__(self, path, max_changes=None, max_age=None, compact_every=DEFAULT_COMPACT_EVERY):
+        self.path = path
+        # retention: keep the last max_changes changes of a contact, and only those younger than max_age (a timedelta)
+        self.max_changes = max_changes
+        self.max_age = max_age
+        self.compact_every = compact_every
+        # lines appended since the last compaction
+        self.appended = 0
+        self._file = None
+        # contact id -> offsets of its lines, built on the first lookup
+        self._offsets = None
+        # contact id -> (timestamp of its last line, {field: last new value}), for the delta coding of appends
+        self._tails = {}
+        # lookups may come from several threads (server mode), the offset table and tails are shared
+        self._lock = threading.RLock()
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'ab')
+        return self._file
+
+    def _encode(self, contact_id, timestamp, changes):
+        """Encode one update, changes are (field, old value, new value) tuples."""
+        tail = self._tails.get(contact_id)
+        values = tail[1] if tail else {}
+        encoded = []
+        for field, old_value, new_value in changes:
+            code = FIELD_CODES.get(field, field)
+            if code in values and values[code] == old_value:
+                encoded.append([code, new_value])
+            else:
+                encoded.append([code, new_value, old_value])
+            values[code] = new_value
+        stamp = f"+{timestamp - tail[0]}" if tail else str(timestamp)
+        self._tails[contact_id] = (timestamp, values)
+        return f"{contact_id}\t{stamp}\t{json.dumps(encoded, separators=(',', ':'), default=str)}\n".encode('utf-8')
+
+    def _write(self, contact_id, line, deleted=False):
+        file = self._open()
+        if self._offsets is not None:
+            if deleted:
+                self._offsets.pop(contact_id, None)
+            else:
+                self._offsets.setdefault(contact_id, array('q')).append(file.tell())
+        file.write(line)
+        self.appended += 1
+
+    def append(self, contact_id, timestamp, changes):
+        """Record one update of a contact: changes made at timestamp (a datetime), as (field, old, new) tuples."""
+        self.append_many([(contact_id, timestamp, changes)])
+
+    def append_many(self, updates):
+        """Record many (contact id, timestamp, changes) updates with one flush."""
+        with self._lock:
+            for contact_id, timestamp, changes in updates:
+                if changes:
+                    self._write(contact_id, self._encode(contact_id, utils.to_epoch_us(timestamp), changes))
+            if self._file is not None:
+                self._file.flush()
+
+    def forget(self, contact_ids):
+        """Drop the history of deleted contacts."""
+        with self._lock:
+            for contact_id in contact_ids:
+                self._tails.pop(contact_id, None)
+                self._write(contact_id, f"{contact_id}\t{DELETED}\n".encode('utf-8'), deleted=True)
+            if self._file is not None:
+                self._file.flush()
+
+    def sync(self):
+        """Force the lines appended so far onto the disk."""
+        with self._lock:
+            # nothing to sync for a history which isn't kept (os.devnull can't be fsynced)
+            if self._file is not None and self.path != os.devnull:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def _lines(self):
+        """Yield (offset, contact id, rest of the line) for every complete line of the file."""
+        if not os.path.exists(self.path):
+            return
+        if self._file is not None:
+            self._file.flush()
+        offset = 0
+        with open(self.path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    # torn by a crash in the middle of a write
+                    logger.warning("Dropping a torn record at the end of %s", self.path)
+                    self.close()
+                    os.truncate(self.path, offset)
+                    return
+                contact_id, _, rest = line.partition(b'\t')
+                yield offset, int(contact_id), rest
+                offset += len(line)
+
+    def _build_offsets(self):
+        self._offsets = {}
+        for offset, contact_id, rest in self._lines():
+            if rest.startswith(DELETED.encode()):
+                self._offsets.pop(contact_id, None)
+            else:
+                self._offsets.setdefault(contact_id, array('q')).append(offset)
+
+    @staticmethod
+    def _decode(lines):
+        """Decode the lines of one contact into (timestamp, field, old, new) records, plus its tail state."""
+        records = []
+        timestamp = None
+        values = {}
+        for rest in lines:
+            stamp, _, changes = rest.partition(b'\t')
+            timestamp = timestamp + int(stamp[1:]) if stamp.startswith(b'+') else int(stamp)
+            for change in json.loads(changes):
+                code, new_value = change[0], change[1]
+                old_value = change[2] if len(change) > 2 else values.get(code)
+                values[code] = new_value
+                records.append((timestamp, _decode_field(code), old_value, new_value))
+        return records, ((timestamp, values) if records else None)
+
+    def _retained(self, records):
+        if self.max_age is not None:
+            oldest = utils.to_epoch_us(utils.get_current_time() - self.max_age)
+            records = [record for record in records if record[0] >= oldest]
+        if self.max_changes is not None:
+            records = records[-self.max_changes:] if self.max_changes else []
+        return records
+
+    def records(self, contact_id):
+        """The retained history of a contact, as (timestamp in epoch microseconds, field, old, new) tuples."""
+        with self._lock:
+            if self._offsets is None:
+                self._build_offsets()
+            offsets = self._offsets.get(contact_id)
+            if not offsets:
+                return []
+            if self._file is not None:
+                self._file.flush()
+            with open(self.path, 'rb') as file:
+                lines = []
+                for offset in offsets:
+                    file.seek(offset)
+                    lines.append(file.readline().partition(b'\t')[2])
+            records, tail = self._decode(lines)
+            self._tails[contact_id] = tail
+            return self._retained(records)
+
+    def history(self, contact_id):
+        """The retained history of a contact as dicts, oldest first."""
+        return [dict(zip(HISTORY_KEYS, (utils.from_epoch_us(timestamp), field, old_value, new_value)))
+                for timestamp, field, old_value, new_value in self.records(contact_id)]
+
+    def compact(self):
+        """Rewrite the file without the changes retention drops and the history of deleted contacts."""
+        with self._lock:
+            by_contact = {}
+            for _, contact_id, rest in self._lines():
+                if rest.startswith(DELETED.encode()):
+                    by_contact.pop(contact_id, None)
+                else:
+                    by_contact.setdefault(contact_id, []).append(rest)
+            self.close()
+            self._tails = {}
+            self._offsets = {}
+            temp_file = self.path + '.tmp'
+            with open(temp_file, 'wb') as file:
+                for contact_id, lines in by_contact.items():
+                    records, _ = self._decode(lines)
+                    # regroup the retained changes into one line per update
+                    updates = {}
+                    for timestamp, field, old_value, new_value in self._retained(records):
+                        updates.setdefault(timestamp, []).append((field, old_value, new_value))
+                    for timestamp, changes in updates.items():
+                        self._offsets.setdefault(contact_id, array('q')).append(file.tell())
+                        file.write(self._encode(contact_id, timestamp, changes))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_file, self.path)
+            self.appended = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
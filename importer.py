@@ -0,0 +1,197 @@
+"""
+Chunked CSV import pipeline used by PhoneBook.batch_import.
+
+The file is streamed in chunks of raw rows, every chunk is validated (in a process pool when
+there is more than one chunk and more than one worker) and turned into ready-to-build contact
+fields, rejected rows go to a separate CSV file instead of the log. A path ending with .gz is read
+through gzip, so a compressed export (see exporter.py) can be imported again.
+"""
+import collections
+import concurrent.futures
+import csv
+import datetime
+import gzip
+import itertools
+import multiprocessing
+import os
+import time
+
+import metrics
+import utils
+
+DEFAULT_CHUNK_SIZE = 10_000
+# fields of a validated row, in Contact() argument order (after the contact id)
+CONTACT_FIELDS = ('first_name', 'last_name', 'phone_number', 'email_address', 'address', 'created_at', 'updated_at')
+REQUIRED_FIELDS = ('first_name', 'last_name', 'phone_number')
+
+
+class ImportReport:
+    """Summary of one batch import."""
+
+    def __init__(self, csv_file_path, error_file):
+        self.csv_file_path = csv_file_path
+        self.error_file = error_file
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+        # (imported contact id, or None when it was skipped or merged, id of the existing contact, reason)
+        self.duplicates = []
+        self.seconds = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        summary = f"Imported {self.imported} of {self.rows} rows from {self.csv_file_path}"
+        if self.rejected:
+            summary += f" ({self.rejected} rejected, see {self.error_file})"
+        if self.duplicates:
+            summary += f" ({len(self.duplicates)} duplicates)"
+        return summary + f" in {self.seconds:.2f}s, {self.rows_per_sec:,.0f} rows/sec"
+
+
+def default_error_file(csv_file_path):
+    name = os.path.basename(csv_file_path)
+    if name.endswith('.gz'):
+        name = name[:-len('.gz')]
+    name = os.path.splitext(name)[0]
+    return os.path.join('logs', f"{name}_rejects.csv")
+
+
+def parse_time(value):
+    """CSV timestamps are optional, an empty cell means 'now' (decided when the contact is built)."""
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def validate_chunk(header, rows):
+    """
+    Validate a chunk of raw CSV rows.
+
+    Returns (valid, rejects): valid is a list of CONTACT_FIELDS tuples, rejects a list of (row, error).
+    Runs in worker processes, so it only takes and returns plain picklable data.
+    """
+    positions = {name: header.index(name) for name in CONTACT_FIELDS if name in header}
+    missing = [name for name in REQUIRED_FIELDS if name not in positions]
+    if missing:
+        raise ValueError(f"CSV file is missing the columns: {', '.join(missing)}")
+
+    def column(name):
+        i = positions.get(name)
+        if i is None:
+            return [''] * len(rows)
+        return [row[i] if i < len(row) else '' for row in rows]
+
+    columns = [column(name) for name in CONTACT_FIELDS]
+    # phone numbers and emails of the whole chunk are checked in one call
+    masks = utils.validate_many(columns[2], columns[3])
+    valid = []
+    rejects = []
+    for row, mask, first_name, last_name, phone_number, email_address, address, created_at, updated_at \
+            in zip(rows, masks, *columns):
+        if mask:
+            rejects.append((row, utils.error_mask_message(mask)))
+            continue
+        try:
+            if not first_name or not last_name:
+                raise ValueError("first_name and last_name cannot be empty")
+            valid.append((first_name, last_name, phone_number, email_address or None, address or None,
+                          parse_time(created_at), parse_time(updated_at)))
+        except ValueError as e:
+            rejects.append((row, str(e)))
+    return valid, rejects
+
+
+def read_chunks(file, chunk_size):
+    """Yield (header, rows) for every chunk_size raw rows of an open CSV file."""
+    reader = csv.reader(file)
+    header = next(reader, None)
+    if header is None:
+        return
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield header, chunk
+            chunk = []
+    if chunk:
+        yield header, chunk
+
+
+def validate_chunks(chunks, workers=None):
+    """
+    Validate chunks, yielding (header, valid, rejects) in file order.
+
+    With more than one worker, chunks are fanned out to a pool of spawned processes. At most two chunks per
+    worker are in flight, so memory stays bounded by the chunk size rather than the file size.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = iter(chunks)
+    head = list(itertools.islice(chunks, 2))
+    if workers <= 1 or len(head) < 2:
+        # not worth starting a pool for a single chunk
+        for header, rows in itertools.chain(head, chunks):
+            yield (header,) + validate_chunk(header, rows)
+        return
+
+    # spawned, not forked: a fork would copy the log writer and autosave threads' locks in whatever state they're in
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        in_flight = collections.deque()
+        for header, rows in itertools.chain(head, chunks):
+            in_flight.append((header, pool.submit(validate_chunk, header, rows)))
+            if len(in_flight) >= workers * 2:
+                header, future = in_flight.popleft()
+                yield (header,) + future.result()
+        for header, future in in_flight:
+            yield (header,) + future.result()
+
+
+class RejectWriter:
+    """Writes rejected rows, plus the reason, to a CSV file which is only created once needed."""
+
+    def __init__(self, error_file):
+        self.error_file = error_file
+        self._file = None
+        self._writer = None
+
+    def write(self, header, rejects):
+        if not rejects:
+            return
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.error_file) or '.', exist_ok=True)
+            self._file = open(self.error_file, 'w', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(list(header) + ['error'])
+        self._writer.writerows(list(row) + [error] for row, error in rejects)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+def run_import(csv_file_path, build_contact, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, error_file=None):
+    """
+    Stream csv_file_path through the pipeline, calling build_contact(fields, report) for every valid row.
+
+    build_contact returns whether the row was imported. Returns an ImportReport.
+    """
+    report = ImportReport(csv_file_path, error_file or default_error_file(csv_file_path))
+    start = time.perf_counter()
+    reject_writer = RejectWriter(report.error_file)
+    try:
+        with (gzip.open(csv_file_path, 'rt', newline='', encoding='utf-8') if csv_file_path.endswith('.gz')
+              else open(csv_file_path, 'r', newline='')) as file:
+            for header, valid, rejects in validate_chunks(read_chunks(file, chunk_size), workers):
+                for fields in valid:
+                    if build_contact(fields, report):
+                        report.imported += 1
+                reject_writer.write(header, rejects)
+                metrics.count_rejects(rejects)
+                report.rows += len(valid)
+                report.rejected += len(rejects)
+    finally:
+        reject_writer.close()
+    report.rows += report.rejected
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,269 @@
+"""In-memory secondary indexes kept in sync by PhoneBook."""
+import bisect
+import itertools
+import math
+
+import utils
+
+# characters that make a query a real regex rather than a plain (wildcard) substring
+REGEX_META_CHARACTERS = set('.^$*+?{}[]\\|()')
+WILDCARD = '.*'
+NGRAM_SIZE = 3
+
+
+def literal_fragments(query):
+    """
+    Split a wildcard query into the literal pieces it must contain.
+
+    'jo.*son' -> ['jo', 'son']; returns None when the query uses any other regex syntax.
+    """
+    fragments = [fragment for fragment in query.split(WILDCARD) if fragment]
+    for fragment in fragments:
+        if any(char in REGEX_META_CHARACTERS for char in fragment):
+            return None
+    return fragments
+
+
+def ngrams(text):
+    text = text.lower()
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class TrigramIndex:
+    """Inverted trigram index over first name, last name and phone number: trigram -> contact ids."""
+
+    FIELDS = ('first_name', 'last_name', 'phone_number')
+    # the contact fields the keys are made of, an update which changes none of them leaves the index alone
+    fields = FIELDS
+
+    def __init__(self, contacts=()):
+        self.postings = {}
+        for contact in contacts:
+            self.add(contact)
+
+    def _contact_ngrams(self, contact):
+        grams = set()
+        for field in self.FIELDS:
+            grams |= ngrams(getattr(contact, field) or '')
+        return grams
+
+    def add(self, contact):
+        for gram in self._contact_ngrams(contact):
+            self.postings.setdefault(gram, set()).add(contact.contact_id)
+
+    def remove(self, contact):
+        for gram in self._contact_ngrams(contact):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(contact.contact_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def estimate(self, query):
+        """
+        Upper bound of the candidates(query) count without intersecting anything: the rarest trigram's posting size.
+
+        None when the index can't narrow the query down.
+        """
+        fragments = literal_fragments(query)
+        if fragments is None:
+            return None
+        grams = set()
+        for fragment in fragments:
+            grams |= ngrams(fragment)
+        if not grams:
+            return None
+        return min(len(self.postings.get(gram, ())) for gram in grams)
+
+    def candidates(self, query):
+        """
+        Ids of the contacts which may match query, a superset of the real matches.
+
+        Returns None if the index can't narrow the query down (real regex, or no fragment
+        long enough to have a trigram), the caller has to scan every contact then.
+        """
+        fragments = literal_fragments(query)
+        if fragments is None:
+            return None
+        grams = set()
+        for fragment in fragments:
+            grams |= ngrams(fragment)
+        if not grams:
+            return None
+        # intersect from the rarest trigram so the working set stays small
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        result = set(postings[0])
+        for ids in postings[1:]:
+            if not result:
+                break
+            result &= ids
+        return result
+
+
+class SortedDateIndex:
+    """Contact ids sorted by a datetime field, so a time window is a binary search plus a slice."""
+
+    def __init__(self, field, contacts=()):
+        self.field = field
+        self.fields = (field,)
+        # (datetime, id) pairs, the id breaks ties and makes every key unique
+        self.keys = sorted((getattr(contact, field), contact.contact_id) for contact in contacts)
+
+    def _key(self, contact):
+        return getattr(contact, self.field), contact.contact_id
+
+    def add(self, contact):
+        bisect.insort(self.keys, self._key(contact))
+
+    def remove(self, contact):
+        key = self._key(contact)
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def _bounds(self, start, end):
+        # (start,) sorts before any (start, id), (end, inf) after any (end, id)
+        lo = bisect.bisect_left(self.keys, (start,))
+        return lo, bisect.bisect_right(self.keys, (end, math.inf), lo)
+
+    def count(self, start, end):
+        lo, hi = self._bounds(start, end)
+        return hi - lo
+
+    def range(self, start, end, reverse=False):
+        """Lazily yield the ids with start <= field <= end, in date order (newest first with reverse)."""
+        lo, hi = self._bounds(start, end)
+        for i in (range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)):
+            yield self.keys[i][1]
+
+
+class PhoneIndex:
+    """Hash index from the normalized phone number (utils.phone_key) to contact ids, for reverse lookups."""
+
+    fields = ('phone_number',)
+
+    def __init__(self, contacts=()):
+        # key -> id, or a set of ids for a number which several contacts share
+        self.keys = {}
+        for contact in contacts:
+            self.add(contact)
+
+    def add(self, contact):
+        key = utils.phone_key(contact.phone_number)
+        if key is None:
+            return
+        ids = self.keys.get(key)
+        if ids is None:
+            self.keys[key] = contact.contact_id
+        elif isinstance(ids, set):
+            ids.add(contact.contact_id)
+        else:
+            self.keys[key] = {ids, contact.contact_id}
+
+    def remove(self, contact):
+        key = utils.phone_key(contact.phone_number)
+        ids = self.keys.get(key)
+        if ids is None:
+            return
+        if isinstance(ids, set):
+            ids.discard(contact.contact_id)
+            if len(ids) == 1:
+                self.keys[key] = ids.pop()
+        elif ids == contact.contact_id:
+            del self.keys[key]
+
+    def ids(self, key):
+        """Ids of the contacts with phone key, in id order."""
+        ids = self.keys.get(key)
+        if ids is None:
+            return []
+        if isinstance(ids, set):
+            return sorted(ids)
+        return [ids]
+
+
+def initial_of(last_name):
+    return last_name[0].upper()
+
+
+class SortedNameIndex:
+    """
+    Contact ids in alphabetical order of (last name, first name, id), overall and per initial of the last name.
+
+    Both are kept sorted on every change, so the sorted and grouped views never need a full sort,
+    and a page is a slice.
+    """
+
+    fields = ('last_name', 'first_name')
+
+    def __init__(self, contacts=()):
+        self.keys = sorted(self._key(contact) for contact in contacts)
+        self.groups = {}
+        for key in self.keys:
+            # keys are visited in order, so every group comes out sorted as well
+            self.groups.setdefault(initial_of(key[0]), []).append(key)
+
+    @staticmethod
+    def _key(contact):
+        return contact.last_name, contact.first_name, contact.contact_id
+
+    def add(self, contact):
+        key = self._key(contact)
+        bisect.insort(self.keys, key)
+        bisect.insort(self.groups.setdefault(initial_of(key[0]), []), key)
+
+    def remove(self, contact):
+        key = self._key(contact)
+        initial = initial_of(key[0])
+        for keys in (self.keys, self.groups.get(initial, [])):
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+        if initial in self.groups and not self.groups[initial]:
+            del self.groups[initial]
+
+    def _keys(self, initial=None):
+        return self.keys if initial is None else self.groups.get(initial, [])
+
+    def count(self, initial=None):
+        return len(self._keys(initial))
+
+    def initials(self):
+        return sorted(self.groups)
+
+    def _prefix_bounds(self, prefix):
+        """(lo, hi) slices of keys whose last name starts with prefix, ignoring case, in key order."""
+        # one slice per upper/lower case spelling of the first few characters, the rest of the prefix
+        # has to be checked by the caller; spellings are sorted, so their slices come out in key order
+        head = prefix[:3]
+        spellings = sorted({''.join(chars) for chars in itertools.product(*({c.lower(), c.upper()} for c in head))})
+        bounds = []
+        for spelling in spellings:
+            lo = bisect.bisect_left(self.keys, (spelling,))
+            hi = bisect.bisect_left(self.keys, (spelling + '\U0010ffff',), lo)
+            if hi > lo:
+                bounds.append((lo, hi))
+        return bounds
+
+    def prefix_count(self, prefix):
+        """Number of contacts prefix_ids reads (an upper bound when prefix is longer than 3 characters)."""
+        return sum(hi - lo for lo, hi in self._prefix_bounds(prefix))
+
+    def prefix_ids(self, prefix, reverse=False):
+        """Lazily yield ids in name order whose last name starts with (the first 3 characters of) prefix."""
+        bounds = self._prefix_bounds(prefix)
+        if reverse:
+            for lo, hi in reversed(bounds):
+                for i in range(hi - 1, lo - 1, -1):
+                    yield self.keys[i][2]
+        else:
+            for lo, hi in bounds:
+                for i in range(lo, hi):
+                    yield self.keys[i][2]
+
+    def ids(self, offset=0, limit=None, initial=None):
+        """Lazily yield ids in name order, from offset, at most limit of them, optionally of one initial."""
+        keys = self._keys(initial)
+        end = len(keys) if limit is None else min(len(keys), offset + limit)
+        for i in range(offset, end):
+            yield keys[i][2]
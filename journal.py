@@ -0,0 +1,150 @@
+"""
+Append-only write-ahead journal of PhoneBook mutations.
+
+Every add/update/delete is appended as one JSON line. Lines are handed to the OS right away (so a crash
+of the application loses nothing), fsync is batched: at most every sync_every records or sync_interval
+seconds. PhoneBook.save_contacts writes a full snapshot and truncates the journal (compaction), and
+load_contacts replays the journal on top of the snapshot. A background save (see autosave.py) only drops the
+records up to the mark taken with its snapshot, the ones appended while it was writing stay.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+import log_pipeline
+
+logger = log_pipeline.get_logger('journal')
+
+DEFAULT_SYNC_EVERY = 100
+DEFAULT_SYNC_INTERVAL = 1.0
+
+
+class Journal:
+
+    def __init__(self, path, sync_every=DEFAULT_SYNC_EVERY, sync_interval=DEFAULT_SYNC_INTERVAL):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        # records written since the last compaction
+        self.records = 0
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._deferred = 0
+        # counts truncations, a mark taken before one doesn't point into the file anymore
+        self._truncations = 0
+        # the background save drops records from its own thread
+        self._lock = threading.RLock()
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def append(self, record):
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            self._open().write(line)
+            self.records += 1
+            self._unsynced += 1
+            if not self._deferred:
+                self._flush()
+
+    @contextlib.contextmanager
+    def deferred(self):
+        """Buffer the records of a bulk operation and flush them once at the end."""
+        self._deferred += 1
+        try:
+            yield self
+        finally:
+            self._deferred -= 1
+            if not self._deferred:
+                with self._lock:
+                    self._flush()
+
+    def _flush(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Force everything written so far onto the disk."""
+        with self._lock:
+            if self._file is None or not self._unsynced:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def read(self):
+        """Yield the journal records, a torn last line (crash in the middle of a write) is cut off."""
+        self.records = 0
+        if not os.path.exists(self.path):
+            return
+        good_size = 0
+        with open(self.path, 'rb') as file:
+            for line in file:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("incomplete line")
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("Dropping a torn record at the end of %s", self.path)
+                    break
+                good_size += len(line)
+                self.records += 1
+                yield record
+        if good_size != os.path.getsize(self.path):
+            # so the next append doesn't land on the same line as the torn one
+            os.truncate(self.path, good_size)
+
+    def truncate(self):
+        """Drop every record, called once they are all part of a snapshot."""
+        with self._lock:
+            self.close()
+            with open(self.path, 'w'):
+                pass
+            self.records = 0
+            self._truncations += 1
+
+    def mark(self):
+        """The current end of the journal, see drop_through."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            return self._truncations, size, self.records
+
+    def drop_through(self, mark):
+        """Drop the records before mark, once a snapshot taken at mark holds them; later records are kept."""
+        truncations, size, records = mark
+        with self._lock:
+            if truncations != self._truncations:
+                # truncated by a newer save since, the records are gone already
+                return
+            self.close()
+            with open(self.path, 'rb') as file:
+                file.seek(size)
+                rest = file.read()
+            # same temp file + rename as the contacts file, a crash leaves either journal, both replay fine
+            temp_file = self.path + '.tmp'
+            with open(temp_file, 'wb') as file:
+                file.write(rest)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_file, self.path)
+            self.records -= records
+            self._truncations += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self.sync()
+                self._file.close()
+                self._file = None
@@ -0,0 +1,88 @@
+"""
+Background logging for the phone book.
+
+Records go through a queue to a writer thread, so logging never waits on file I/O, and messages use
+%-style arguments which are only formatted (in the writer thread) when the record is actually written.
+Every operation logs to its own 'phone_book.<operation>' logger, whose level and sampling can be
+configured separately, e.g. only keep one in 100 'update' records during a sync.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+OPERATIONS = ('add', 'update', 'delete', 'import', 'export', 'load', 'save', 'journal', 'history', 'server', 'shards')
+
+_listener = None
+
+
+class _BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """The stock QueueHandler formats the message before queueing it, leave that to the writer thread."""
+
+    def prepare(self, record):
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Let one record in every sample_every through."""
+
+    def __init__(self, sample_every):
+        super().__init__()
+        self.sample_every = sample_every
+        self._seen = 0
+
+    def filter(self, record):
+        self._seen += 1
+        return (self._seen - 1) % self.sample_every == 0
+
+
+def get_logger(operation):
+    return logging.getLogger(f'phone_book.{operation}')
+
+
+def configure_operation(operation, level=None, sample_every=None):
+    """
+    Set the log level and/or sampling of one operation.
+
+    level is a logging level (name or number), sample_every=n keeps one record in n (1 or None keeps all).
+    """
+    logger = get_logger(operation)
+    if level is not None:
+        logger.setLevel(level)
+    for existing in [f for f in logger.filters if isinstance(f, SamplingFilter)]:
+        logger.removeFilter(existing)
+    if sample_every and sample_every > 1:
+        logger.addFilter(SamplingFilter(sample_every))
+
+
+def setup_logging(log_file='logs/phone_book.log', level=logging.INFO, operations=None):
+    """
+    Route logging to log_file through a queue and a background writer thread.
+
+    Like logging.basicConfig, it does nothing when the root logger already has handlers (set up by
+    the application embedding the phone book, or by an earlier call).
+    operations maps operation names to configure_operation keyword arguments.
+    """
+    global _listener
+    for operation, settings in (operations or {}).items():
+        configure_operation(operation, **settings)
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    root.addHandler(_BackgroundQueueHandler(records))
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(records, file_handler)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Write out whatever is still queued and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,9 +1,13 @@
+import argparse
 import datetime
 import sys
 import os
 
 from phone_book import PhoneBook
 from contact import Contact
+from render import Pager
+import autosave
+import server
 import utils
 
 KEYWORD_CLEAN_UP = 'CLEAN UP'
@@ -23,8 +27,38 @@ def welcome():
     ).strip()
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Phone Book Management Application")
+    parser.add_argument('--storage', choices=PhoneBook.STORAGES, default='objects',
+                        help="where contacts are kept while running: 'objects' (default), 'columns' (less memory) "
+                             "or 'sqlite' (database file, for books larger than RAM)")
+    parser.add_argument('--contacts-file',
+                        help="contacts file, data/contacts.json by default (data/contacts.db with --storage sqlite)")
+    parser.add_argument('--serve', action='store_true',
+                        help="serve the phone book over a local HTTP/JSON API instead of the interactive menu")
+    parser.add_argument('--autosave-interval', type=float, default=autosave.DEFAULT_INTERVAL,
+                        help="seconds between background saves while the book changes, 0 turns autosave off")
+    parser.add_argument('--autosave-changes', type=int, default=autosave.DEFAULT_DIRTY_THRESHOLD,
+                        help="also save in the background once this many changes piled up")
+    parser.add_argument('--host', default=server.DEFAULT_HOST, help="address to serve on (with --serve)")
+    parser.add_argument('--port', type=int, default=server.DEFAULT_PORT, help="port to serve on (with --serve)")
+    export = parser.add_argument_group("export", "write the contacts to a file instead of the interactive menu")
+    export.add_argument('--export', metavar='PATH',
+                        help="export file: .csv (the batch import columns) or .ndjson, add .gz to compress")
+    export.add_argument('--fields', help="comma separated columns to export, all of them by default")
+    export.add_argument('--query', help="only contacts matching this search (regex, like Search Contacts)")
+    export.add_argument('--since', type=datetime.datetime.fromisoformat,
+                        help="only contacts changed (--date-field) at or after this ISO time")
+    export.add_argument('--until', type=datetime.datetime.fromisoformat,
+                        help="only contacts changed (--date-field) at or before this ISO time")
+    export.add_argument('--date-field', choices=('updated_at', 'created_at'), default='updated_at',
+                        help="the date --since/--until apply to")
+    return parser.parse_args(argv)
+
+
 def main():
     """Entrance function to run the phone book application with Command-Line Interface (CLI)."""
+    args = parse_args()
 
     # Ensure logs/data directories exist
     # logging file directory
@@ -32,15 +66,45 @@ def main():
     # contacts json file directory
     os.makedirs('data', exist_ok=True)
 
-    # Instantiate the Phone Book with persistence
-    phone_book = PhoneBook()
+    # Instantiate the Phone Book with persistence,
+    # every change is journaled right away so a crash doesn't lose the session
+    # (the sqlite storage commits every change to the database itself)
+    if args.storage == 'sqlite':
+        phone_book = PhoneBook(args.contacts_file or 'data/contacts.db', storage='sqlite')
+    else:
+        # the journal belongs to one contacts file, named after it like the history (data/contacts.json.journal)
+        contacts_file = args.contacts_file or 'data/contacts.json'
+        phone_book = PhoneBook(contacts_file, storage=args.storage, journal_file=contacts_file + '.journal')
     # also we can consider to combine the load_contacts() into PhoneBook() init function
     # it makes PhoneBook() easier to use, although it might contradict to the principle of single responsibility
     phone_book.load_contacts()
 
+    if args.export:
+        print(phone_book.export_contacts(args.export, fields=args.fields.split(',') if args.fields else None,
+                                         query=args.query, start_date=args.since, end_date=args.until,
+                                         date_field=args.date_field))
+        return
+
+    if args.serve:
+        # the server saves the book in the background and once more when it stops
+        server.run(phone_book, args.host, args.port)
+        return
+
+    # saves in the background instead of only on exit, the snapshot it takes waits for the change in progress
+    if phone_book.storage != 'sqlite' and args.autosave_interval > 0:
+        phone_book.start_autosave(args.autosave_interval, args.autosave_changes)
+
     while True:
         choice = welcome()
 
+        if choice == '6':
+            # save contacts data before we quit the application (this also compacts the journal),
+            # once the background save in progress, if any, is written
+            phone_book.stop_autosave()
+            phone_book.save_contacts()
+            print("Exiting the Phone Book Application. Goodbye!")
+            sys.exit()
+
         if choice == '1':
             create_contacts_cli(phone_book)
         elif choice == '2':
@@ -51,11 +115,6 @@ def main():
             delete_contacts_cli(phone_book)
         elif choice == '5':
             view_contacts_cli(phone_book)
-        elif choice == '6':
-            # save contacts data before we quit the application
-            phone_book.save_contacts()
-            print("Exiting the Phone Book Application. Goodbye!")
-            sys.exit()
         else:
             print("Invalid choice. Please try again.")
 
@@ -109,13 +168,16 @@ def batch_import_contacts_cli(phone_book):
     CLI function to import contacts from a CSV file.
 
     If the CSV file contains any invalid row records,
-    logging system will automatically write it down (importing record errors),
-    and you can check it in the log file
+    they are written down with the reason to a rejects CSV file (logs/<csv name>_rejects.csv),
+    and you can check it there.
+    Rows duplicating an existing contact can be skipped, merged into it or flagged.
     """
     csv_file_path = input("Enter the path to the CSV file: ").strip()
+    dedup_mode = input("Duplicate contacts (skip/merge/flag, press Enter to import everything): ").strip().lower()
     try:
-        phone_book.batch_import(csv_file_path)
+        report = phone_book.batch_import(csv_file_path, dedup_mode=dedup_mode or None)
         print("Contacts imported successfully.")
+        print(report)
     except FileNotFoundError:
         print(f"File not found: {csv_file_path}")
     except Exception as e:
@@ -141,13 +203,13 @@ def search_contacts_cli(phone_book):
         if choice == '1':
             query = input("Enter search query (use .* for wildcard): ")
             results = phone_book.search_contacts(query)
-            utils.print_contacts(results)
+            Pager.of(results).run()
         elif choice == '2':
             print('please use the ios time format (yyyy-mm-dd hh:mm:ss) for input')
             start_time = utils.get_valid_time(f"Start Time:")
             end_time = utils.get_valid_time(f"End Time:")
-            results = phone_book.filter_contacts_by_date(start_time, end_time)
-            utils.print_contacts(results)
+            # read lazily, page by page
+            Pager.of(phone_book.iter_contacts_by_date(start_time, end_time)).run()
         elif choice == '3':
             break
         else:
@@ -255,19 +317,18 @@ def delete_contacts_cli(phone_book):
         print("No valid IDs entered. Back to Main Menu.")
         return
 
-    not_found_ids = []
-    deleted_contact_ids = []
     for contact_id in contact_ids:
         if not contact_id.isdigit():
             print("Invalid Contact ID. It must be an integer.")
             return
-        contact = phone_book.get_contact_by_id(int(contact_id))
-        if contact:
-            phone_book.delete_contact(contact)
-            deleted_contact_ids.append(contact_id)
-            print(f"Deleted contact: {contact.first_name} {contact.last_name} (ID: {contact_id})")
-        else:
-            not_found_ids.append(contact_id)
+
+    # delete all the ids in one pass instead of looking them up one by one
+    deleted_contacts = phone_book.delete_contacts(int(contact_id) for contact_id in contact_ids)
+    for contact in deleted_contacts:
+        print(f"Deleted contact: {contact.first_name} {contact.last_name} (ID: {contact.contact_id})")
+
+    deleted_contact_ids = {contact.contact_id for contact in deleted_contacts}
+    not_found_ids = [contact_id for contact_id in contact_ids if int(contact_id) not in deleted_contact_ids]
 
     if not_found_ids:
         print(f"The following IDs were not found and could not be deleted: {', '.join(not_found_ids)}")
@@ -295,13 +356,10 @@ def view_contacts_cli(phone_book):
         ).strip()
 
         if choice == '1':
-            contacts = phone_book.sort_contacts()
-            utils.print_contacts(contacts)
+            # pages are slices of the name index, only the page shown is read
+            Pager(lambda offset, limit: phone_book.iter_sorted(offset, limit), total=len(phone_book)).run()
         elif choice == '2':
-            groups = phone_book.group_contacts()
-            for initial, group in sorted(groups.items()):
-                print(f"\nContacts starting with '{initial}':")
-                utils.print_contacts(group)
+            Pager.of(_grouped(phone_book)).run()
         elif choice == '3':
             view_contact_history_cli(phone_book)
         elif choice == '4':
@@ -310,6 +368,13 @@ def view_contacts_cli(phone_book):
             print("Invalid choice. Please try again.")
 
 
+def _grouped(phone_book):
+    """Contacts group by group (initial of the last name), each group after its heading."""
+    for initial in phone_book.group_counts():
+        yield f"\nContacts starting with '{initial}':\n"
+        yield from phone_book.iter_sorted(initial=initial)
+
+
 def view_contact_history_cli(phone_book):
     """CLI function to view the history of changes for a contact."""
     contact_id = input(
@@ -323,12 +388,14 @@ def view_contact_history_cli(phone_book):
 
     contact = phone_book.get_contact_by_id(int(contact_id))
     if contact:
-        if contact.history:
+        # read from the history store on demand, it isn't loaded with the book
+        history = phone_book.get_contact_history(contact.contact_id)
+        if history:
             print(f"\nHistory for contact {contact.first_name} {contact.last_name} (ID: {contact.contact_id}):")
-            for record in contact.history:
+            for record in history:
                 print(f"\n---------------------------------")
                 print(
-                    f"\nTimestamp: {datetime.datetime.fromisoformat(record['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}" +
+                    f"\nTimestamp: {record['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}" +
                     f"\nField Changed: {record['field']}" +
                     f"\nOld Value: {record['old_value']}" +
                     f"\nNew Value: {record['new_value']}")
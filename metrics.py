@@ -0,0 +1,247 @@
+"""
+Optional instrumentation: per-operation counters and latency histograms, and rejected rows per validation rule.
+
+Off by default and free when off: PhoneBook and Contact register the methods to time, but they are only wrapped
+once metrics are enabled, otherwise the class is left untouched. Enable it without changing any code with the
+PHONE_BOOK_METRICS environment variable, set to the file to write the Prometheus text dump to:
+
+    PHONE_BOOK_METRICS=logs/phone_book.prom python3 main.py
+
+The file is rewritten every PHONE_BOOK_METRICS_INTERVAL seconds (10 by default) and at exit, for the Prometheus
+node exporter textfile collector or just to read. From code: metrics.enable() / metrics.stats() / metrics.disable().
+"""
+import atexit
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+
+import utils
+
+ENV_VAR = 'PHONE_BOOK_METRICS'
+INTERVAL_ENV_VAR = 'PHONE_BOOK_METRICS_INTERVAL'
+DEFAULT_INTERVAL = 10.0
+# latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+# validation rule -> text of its error message, see utils.error_mask_message and importer.validate_chunk
+RULES = (('phone_number', utils.PHONE_NUMBER_ERROR), ('email_address', utils.EMAIL_ERROR),
+         ('required_field', 'cannot be empty'))
+
+_lock = threading.Lock()
+_operations = {}
+_rejects = {}
+# (class, {method name: operation}) registered by the instrumented modules
+_registered = []
+_enabled = False
+_dump_thread = None
+_dump_stop = None
+
+
+class _Operation:
+    __slots__ = ('count', 'errors', 'seconds', 'max_seconds', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        # one count per bucket plus the +Inf one, not cumulative
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+
+def rules_of(message):
+    """Validation rules an error message reports, [] when it isn't a validation error."""
+    return [rule for rule, text in RULES if text in message]
+
+
+def observe(operation, seconds, error=None):
+    """Record one call of operation which took seconds, and failed with error if given."""
+    with _lock:
+        stats = _operations.get(operation)
+        if stats is None:
+            stats = _operations[operation] = _Operation()
+        stats.count += 1
+        stats.seconds += seconds
+        if seconds > stats.max_seconds:
+            stats.max_seconds = seconds
+        stats.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        if error is not None:
+            stats.errors += 1
+    # a validation error raised through several timed calls (e.g. Contact() inside load_contacts) counts once
+    if isinstance(error, ValueError) and not getattr(error, '_metrics_counted', False):
+        error._metrics_counted = True
+        for rule in rules_of(str(error)):
+            reject(rule)
+
+
+def reject(rule, count=1):
+    if not _enabled:
+        return
+    with _lock:
+        _rejects[rule] = _rejects.get(rule, 0) + count
+
+
+def count_rejects(rejects):
+    """Count the (row, error message) rejects of a batch import chunk per validation rule."""
+    if not _enabled or not rejects:
+        return
+    for row, error in rejects:
+        for rule in rules_of(error) or ['other']:
+            reject(rule)
+
+
+def _timed(func, operation):
+    if inspect.isgeneratorfunction(func):
+        # lazy iterators: time spent producing the items, not the consumer's time in between
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            iterator = func(*args, **kwargs)
+            elapsed = 0.0
+            error = None
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield item
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                observe(operation, elapsed, error)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                observe(operation, time.perf_counter() - start, error)
+                raise
+            observe(operation, time.perf_counter() - start)
+            return result
+    wrapper._metrics_original = func
+    return wrapper
+
+
+def _instrument(cls, methods):
+    for name, operation in methods.items():
+        method = cls.__dict__[name]
+        if not hasattr(method, '_metrics_original'):
+            setattr(cls, name, _timed(method, operation))
+
+
+def _uninstrument(cls, methods):
+    for name in methods:
+        original = getattr(cls.__dict__[name], '_metrics_original', None)
+        if original is not None:
+            setattr(cls, name, original)
+
+
+def register(cls, methods):
+    """Time the methods of cls ({method name: operation}) while metrics are enabled."""
+    _registered.append((cls, methods))
+    if _enabled:
+        _instrument(cls, methods)
+
+
+def enable(dump_file=None, interval=DEFAULT_INTERVAL):
+    """Start collecting; with dump_file, also write the Prometheus text to it every interval seconds and at exit."""
+    global _enabled, _dump_thread, _dump_stop
+    _enabled = True
+    for cls, methods in _registered:
+        _instrument(cls, methods)
+    if dump_file and _dump_thread is None:
+        _dump_stop = threading.Event()
+
+        def dump_periodically(stop):
+            while not stop.wait(interval):
+                write_prometheus(dump_file)
+
+        _dump_thread = threading.Thread(target=dump_periodically, args=(_dump_stop,), name='metrics-dump',
+                                        daemon=True)
+        _dump_thread.start()
+        atexit.register(write_prometheus, dump_file)
+
+
+def disable():
+    """Stop collecting and put the original methods back; what was collected stays until reset()."""
+    global _enabled, _dump_thread
+    _enabled = False
+    for cls, methods in _registered:
+        _uninstrument(cls, methods)
+    if _dump_thread is not None:
+        _dump_stop.set()
+        _dump_thread = None
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _operations.clear()
+        _rejects.clear()
+
+
+def stats():
+    """
+    Everything collected so far:
+    {'operations': {operation: {count, errors, seconds, mean_seconds, max_seconds, buckets}}, 'rejects': {rule: rows}}
+
+    buckets maps each bucket upper bound (seconds, 'inf' last) to the number of calls at most that long.
+    """
+    with _lock:
+        operations = {}
+        for operation, op in sorted(_operations.items()):
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(BUCKETS + ('inf',), op.buckets):
+                cumulative += count
+                buckets[bound] = cumulative
+            operations[operation] = {'count': op.count, 'errors': op.errors, 'seconds': op.seconds,
+                                     'mean_seconds': op.seconds / op.count if op.count else 0.0,
+                                     'max_seconds': op.max_seconds, 'buckets': buckets}
+        return {'enabled': _enabled, 'operations': operations, 'rejects': dict(sorted(_rejects.items()))}
+
+
+def prometheus_text():
+    """stats() in the Prometheus text exposition format."""
+    current = stats()
+    lines = ['# HELP phone_book_operation_seconds Latency of phone book operations.',
+             '# TYPE phone_book_operation_seconds histogram']
+    for operation, op in current['operations'].items():
+        for bound, count in op['buckets'].items():
+            le = '+Inf' if bound == 'inf' else repr(bound)
+            lines.append(f'phone_book_operation_seconds_bucket{{operation="{operation}",le="{le}"}} {count}')
+        lines.append(f'phone_book_operation_seconds_sum{{operation="{operation}"}} {op["seconds"]!r}')
+        lines.append(f'phone_book_operation_seconds_count{{operation="{operation}"}} {op["count"]}')
+    lines += ['# HELP phone_book_operation_errors_total Phone book operations which raised an error.',
+              '# TYPE phone_book_operation_errors_total counter']
+    for operation, op in current['operations'].items():
+        lines.append(f'phone_book_operation_errors_total{{operation="{operation}"}} {op["errors"]}')
+    lines += ['# HELP phone_book_rejected_total Contacts rejected, per validation rule.',
+              '# TYPE phone_book_rejected_total counter']
+    for rule, count in current['rejects'].items():
+        lines.append(f'phone_book_rejected_total{{rule="{rule}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    """Write prometheus_text() to path, through a temp file so readers never see half of it."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w') as file:
+        file.write(prometheus_text())
+    os.replace(temp_file, path)
+
+
+if os.environ.get(ENV_VAR):
+    enable(os.environ[ENV_VAR], float(os.environ.get(INTERVAL_ENV_VAR) or DEFAULT_INTERVAL))
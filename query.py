@@ -0,0 +1,405 @@
+"""
+Composite queries over a PhoneBook: predicates combined with AND, an order, limit and offset.
+
+    phone_book.query().name_prefix('Jo').created_between(start, end).email_domain('gmail.com') \\
+        .order_by('last_name').limit(20).all()
+
+A small planner picks how to read the contacts. Every indexed predicate offers an access path with an exact or
+estimated row count (phone -> phone index, last name prefix -> name index, date range -> date index, search ->
+trigram index), next to a full scan and, when ordered, a full walk of the index in that order. The estimated cost
+is the rows read, or fewer when the path already comes out in the requested order and a limit lets it stop early,
+plus a sort when it doesn't. The cheapest path is read, the other predicates filter the stream, and reading stops
+once offset + limit rows matched. explain() shows the candidates and the choice.
+
+The sqlite storage has its own planner: the query is compiled to one SQL statement and explain() shows
+SQLite's EXPLAIN QUERY PLAN.
+"""
+import copy
+import datetime
+import heapq
+import math
+import re
+
+import metrics
+import utils
+
+STRING_FIELDS = ('first_name', 'last_name', 'phone_number', 'email_address', 'address')
+DATE_FIELDS = ('created_at', 'updated_at')
+ORDERS = ('last_name', 'created_at', 'updated_at', 'id')
+# selectivity guessed for predicates without an index to count them
+DEFAULT_SELECTIVITY = 0.1
+
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class Prefix:
+    """field starts with text, ignoring case."""
+
+    def __init__(self, field, text):
+        self.field = field
+        self.text = text
+        self._lower = text.lower()
+
+    def matches(self, contact):
+        value = getattr(contact, self.field)
+        return bool(value) and value.lower().startswith(self._lower)
+
+    def sql(self):
+        # LIKE ignores (ASCII) case
+        return f"c.{self.field} LIKE ? ESCAPE '\\'", [_like_escape(self.text) + '%']
+
+    def __str__(self):
+        return f"{self.field} prefix {self.text!r}"
+
+
+class Contains:
+    """field contains text, ignoring case."""
+
+    def __init__(self, field, text):
+        self.field = field
+        self.text = text
+        self._lower = text.lower()
+
+    def matches(self, contact):
+        value = getattr(contact, self.field)
+        return bool(value) and self._lower in value.lower()
+
+    def sql(self):
+        return f"instr(lower(c.{self.field}), ?) > 0", [self._lower]
+
+    def __str__(self):
+        return f"{self.field} contains {self.text!r}"
+
+
+class Search:
+    """The search_contacts regex: first name, last name or phone number match, ignoring case."""
+
+    def __init__(self, query):
+        self.query = query
+        self.pattern = re.compile(query, re.IGNORECASE)
+
+    def matches(self, contact):
+        search = self.pattern.search
+        return bool(search(contact.first_name) or search(contact.last_name) or search(contact.phone_number))
+
+    def sql(self):
+        return "(c.first_name REGEXP ? OR c.last_name REGEXP ? OR c.phone_number REGEXP ?)", [self.query] * 3
+
+    def __str__(self):
+        return f"search {self.query!r}"
+
+
+class Between:
+    """start <= date field <= end, either end can be open (None)."""
+
+    def __init__(self, field, start, end):
+        self.field = field
+        self.start = start or datetime.datetime.min
+        self.end = end or datetime.datetime.max
+
+    def matches(self, contact):
+        return self.start <= getattr(contact, self.field) <= self.end
+
+    def sql(self):
+        return f"c.{self.field} BETWEEN ? AND ?", [utils.to_epoch_us(self.start), utils.to_epoch_us(self.end)]
+
+    def __str__(self):
+        return f"{self.field} between {self.start} and {self.end}"
+
+
+class EmailDomain:
+    """The email address is at domain, ignoring case."""
+
+    def __init__(self, domain):
+        self.domain = domain.lstrip('@')
+        self._suffix = '@' + self.domain.lower()
+
+    def matches(self, contact):
+        return bool(contact.email_address) and contact.email_address.lower().endswith(self._suffix)
+
+    def sql(self):
+        return "lower(c.email_address) LIKE ? ESCAPE '\\'", ['%' + _like_escape(self._suffix)]
+
+    def __str__(self):
+        return f"email domain {self.domain!r}"
+
+
+class Phone:
+    """The phone number is number, however number is written (see utils.phone_key)."""
+
+    def __init__(self, number):
+        self.number = number
+        self.key = utils.phone_key(number)
+
+    def matches(self, contact):
+        return self.key is not None and utils.phone_key(contact.phone_number) == self.key
+
+    def sql(self):
+        if self.key is None:
+            return "0", []
+        return "c.phone_number = ?", [utils.format_phone_number(self.key)]
+
+    def __str__(self):
+        return f"phone {self.number!r}"
+
+
+class Plan:
+    """
+    One way to read the contacts: rows it reads, the order they come in, the predicate those rows are counted for
+    and whether they match it exactly (no need to check it again) or are only candidates.
+    """
+
+    def __init__(self, name, rows, order, read, predicate=None, exact=False):
+        self.name = name
+        self.rows = rows
+        self.order = order
+        # read(reverse) -> iterator of contacts
+        self.read = read
+        self.predicate = predicate
+        self.exact = predicate if exact else None
+        self.cost = None
+        self.sorts = False
+
+
+def _sort_key(order):
+    if order == 'last_name':
+        return lambda contact: (contact.last_name, contact.first_name, contact.contact_id)
+    if order == 'id':
+        return lambda contact: contact.contact_id
+    return lambda contact: (getattr(contact, order), contact.contact_id)
+
+
+class Query:
+    """Built with PhoneBook.query(); every method returns a new query, so a base query can be reused."""
+
+    def __init__(self, phone_book):
+        self.phone_book = phone_book
+        self.predicates = []
+        self._order = None
+        self._descending = False
+        self._limit = None
+        self._offset = 0
+
+    def _with(self, predicate=None, **settings):
+        query = copy.copy(self)
+        query.predicates = self.predicates + ([predicate] if predicate is not None else [])
+        for name, value in settings.items():
+            setattr(query, '_' + name, value)
+        return query
+
+    # predicates, combined with AND
+
+    def prefix(self, field, text):
+        if field not in STRING_FIELDS:
+            raise ValueError(f"Cannot match a prefix of {field}, expected one of {STRING_FIELDS}")
+        return self._with(Prefix(field, text))
+
+    def name_prefix(self, text):
+        """Last name starts with text (ignoring case)."""
+        return self.prefix('last_name', text)
+
+    def contains(self, field, text):
+        if field not in STRING_FIELDS:
+            raise ValueError(f"Cannot search {field}, expected one of {STRING_FIELDS}")
+        return self._with(Contains(field, text))
+
+    def search(self, query):
+        """Same matching as search_contacts."""
+        return self._with(Search(query))
+
+    def between(self, field, start=None, end=None):
+        if field not in DATE_FIELDS:
+            raise ValueError(f"Cannot filter contacts by {field}")
+        return self._with(Between(field, start, end))
+
+    def created_between(self, start=None, end=None):
+        return self.between('created_at', start, end)
+
+    def updated_between(self, start=None, end=None):
+        return self.between('updated_at', start, end)
+
+    def email_domain(self, domain):
+        return self._with(EmailDomain(domain))
+
+    def phone(self, number):
+        return self._with(Phone(number))
+
+    # shape of the result
+
+    def order_by(self, field, descending=False):
+        """'last_name' (then first name, id), 'created_at', 'updated_at' or 'id'."""
+        if field not in ORDERS:
+            raise ValueError(f"Cannot order contacts by {field}, expected one of {ORDERS}")
+        return self._with(order=field, descending=descending)
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def offset(self, count):
+        return self._with(offset=count)
+
+    # planning
+
+    def _plans(self):
+        """Every access path for the in-memory storages, with its estimated cost; the cheapest first."""
+        phone_book = self.phone_book
+        contacts = phone_book._contacts
+        total = len(contacts)
+        plans = []
+        for predicate in self.predicates:
+            if isinstance(predicate, Phone):
+                ids = phone_book._phones().ids(predicate.key) if predicate.key is not None else []
+                plans.append(Plan(f"phone index ({predicate})", len(ids), 'id',
+                                  lambda reverse, ids=ids: (contacts[i] for i in (reversed(ids) if reverse else ids)),
+                                  predicate, exact=True))
+            elif isinstance(predicate, Prefix) and predicate.field == 'last_name':
+                names = phone_book._sorted_names()
+                plans.append(Plan(f"name index range ({predicate})", names.prefix_count(predicate.text), 'last_name',
+                                  lambda reverse, p=predicate, names=names:
+                                  (contacts[i] for i in names.prefix_ids(p.text, reverse)), predicate))
+            elif isinstance(predicate, Between):
+                index = phone_book._date_index(predicate.field)
+                plans.append(Plan(f"{predicate.field} index range", index.count(predicate.start, predicate.end),
+                                  predicate.field,
+                                  lambda reverse, p=predicate, index=index:
+                                  (contacts[i] for i in index.range(p.start, p.end, reverse)), predicate, exact=True))
+            elif isinstance(predicate, Search):
+                trigrams = phone_book._trigrams()
+                rows = trigrams.estimate(predicate.query)
+                if rows is not None:
+                    plans.append(Plan(f"trigram index ({predicate})", rows, 'id',
+                                      lambda reverse, p=predicate, trigrams=trigrams:
+                                      (contacts[i] for i in sorted(trigrams.candidates(p.query), reverse=reverse)),
+                                      predicate))
+        plans.append(Plan("full scan", total, None, lambda reverse: iter(contacts.values())))
+        if self._order == 'last_name':
+            names = phone_book._sorted_names()
+            plans.append(Plan("name index, full", total, 'last_name',
+                              lambda reverse: (contacts[i] for i in names.prefix_ids('', reverse))))
+        elif self._order in DATE_FIELDS:
+            index = phone_book._date_index(self._order)
+            plans.append(Plan(f"{self._order} index, full", total, self._order,
+                              lambda reverse: (contacts[i] for i in index.range(datetime.datetime.min,
+                                                                                datetime.datetime.max, reverse))))
+
+        matches = self._estimate_matches(plans, total)
+        wanted = None if self._limit is None else self._offset + self._limit
+        for plan in plans:
+            plan.sorts = self._order is not None and plan.order != self._order
+            if plan.sorts:
+                plan.cost = plan.rows + matches * math.log2(matches + 2)
+            elif wanted is not None and matches:
+                # rows read until enough of them matched, if the matches are spread evenly over the path
+                plan.cost = min(plan.rows, wanted * plan.rows / matches)
+            else:
+                plan.cost = plan.rows
+        plans.sort(key=lambda plan: plan.cost)
+        return plans, matches
+
+    def _estimate_matches(self, plans, total):
+        """
+        Rows expected to match everything: the selectivities of the predicates multiplied, as if independent.
+
+        A predicate with an index is as selective as its row count (an upper bound for prefixes and searches).
+        """
+        if not total:
+            return 0
+        counted = {}
+        for plan in plans:
+            if plan.predicate is not None:
+                counted[id(plan.predicate)] = plan.rows
+        estimate = float(total)
+        for predicate in self.predicates:
+            rows = counted.get(id(predicate))
+            estimate *= rows / total if rows is not None else DEFAULT_SELECTIVITY
+        return max(0, min(total, round(estimate))) if self.predicates else total
+
+    def _sql(self):
+        wheres, params = [], []
+        for predicate in self.predicates:
+            where, predicate_params = predicate.sql()
+            wheres.append(where)
+            params += predicate_params
+        direction = ' DESC' if self._descending else ''
+        order = self._order or 'id'
+        if order == 'last_name':
+            order_by = ', '.join(f'c.{column}{direction}' for column in ('last_name', 'first_name', 'id'))
+        elif order == 'id':
+            order_by = f'c.id{direction}'
+        else:
+            order_by = f'c.{order}{direction}, c.id{direction}'
+        return ' AND '.join(wheres), params, order_by
+
+    # running
+
+    def __iter__(self):
+        """Lazily yield the matching contacts."""
+        if self.phone_book.storage == 'sqlite':
+            where, params, order_by = self._sql()
+            yield from self.phone_book._contacts._query(where, params, order_by, self._limit, self._offset)
+            return
+        if self._limit == 0:
+            return
+        plans, _ = self._plans()
+        plan = plans[0]
+        filters = [predicate.matches for predicate in self.predicates if predicate is not plan.exact]
+        rows = plan.read(self._descending and not plan.sorts)
+        matching = (contact for contact in rows if all(match(contact) for match in filters)) if filters else rows
+        if plan.sorts:
+            key = _sort_key(self._order)
+            if self._limit is not None:
+                select = heapq.nlargest if self._descending else heapq.nsmallest
+                ordered = select(self._offset + self._limit, matching, key=key)
+            else:
+                ordered = sorted(matching, key=key, reverse=self._descending)
+            yield from ordered[self._offset:]
+            return
+        end = None if self._limit is None else self._offset + self._limit
+        for i, contact in enumerate(matching):
+            if end is not None and i >= end:
+                break
+            if i >= self._offset:
+                yield contact
+
+    def all(self):
+        return list(self)
+
+    def first(self):
+        return next(iter(self.limit(1)), None)
+
+    def explain(self):
+        """The chosen plan and the alternatives with their row estimates, as text."""
+        lines = [f"Query: {' AND '.join(map(str, self.predicates)) or 'all contacts'}"
+                 + (f" ORDER BY {self._order}{' DESC' if self._descending else ''}" if self._order else '')
+                 + (f" LIMIT {self._limit}" if self._limit is not None else '')
+                 + (f" OFFSET {self._offset}" if self._offset else '')]
+        if self.phone_book.storage == 'sqlite':
+            where, params, order_by = self._sql()
+            lines.append("Storage: sqlite, planned by SQLite:")
+            lines += ['  ' + detail for detail in
+                      self.phone_book._contacts.explain(where, params, order_by, self._limit, self._offset)]
+            return '\n'.join(lines)
+        plans, matches = self._plans()
+        lines.append(f"Book: {len(self.phone_book)} contacts, about {matches} expected to match")
+        lines.append("Access paths (rows read, estimated cost):")
+        for i, plan in enumerate(plans):
+            note = ' + sort' if plan.sorts else ''
+            lines.append(f"  {'*' if i == 0 else ' '} {plan.name}: {plan.rows} rows, cost {plan.cost:.0f}{note}")
+        chosen = plans[0]
+        filters = [str(predicate) for predicate in self.predicates if predicate is not chosen.exact]
+        steps = [f"read {chosen.name}"]
+        if filters:
+            steps.append(f"filter {' AND '.join(filters)}")
+        if chosen.sorts:
+            steps.append(f"{'top ' + str(self._offset + self._limit) if self._limit is not None else 'sort'} "
+                         f"by {self._order}")
+        elif self._limit is not None:
+            steps.append(f"stop after {self._offset + self._limit} matches")
+        lines.append("Plan: " + ', then '.join(steps))
+        return '\n'.join(lines)
+
+
+# timed per contact produced, like the other lazy iterators
+metrics.register(Query, {'__iter__': 'query'})
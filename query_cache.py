@@ -0,0 +1,151 @@
+"""
+LRU caches of search_contacts and date filter results, used by PhoneBook.
+
+A cached result stays correct through mutations: the caches follow the same add/remove protocol as the indexes
+(indexes.py), so a changed contact is taken out of or inserted into the cached results it (no longer) matches
+instead of flushing everything. Storages without in-memory indexes (sqlite) don't patch the caches, for them
+every cache carries the PhoneBook generation it is up to date with and drops its entries when the book has moved on.
+"""
+import bisect
+import collections
+import threading
+
+from indexes import TrigramIndex, literal_fragments
+
+DEFAULT_MAX_ENTRIES = 256
+# contacts over all the cached results, a single larger result isn't cached
+DEFAULT_MAX_RESULTS = 500_000
+
+
+class SearchEntry:
+    """The result of one search, in id order."""
+
+    def __init__(self, pattern, contacts):
+        self.pattern = pattern
+        self.contacts = contacts
+        self.keys = [contact.contact_id for contact in contacts]
+
+    def key(self, contact):
+        return contact.contact_id
+
+    def matches(self, contact):
+        search = self.pattern.search
+        return bool(search(contact.first_name) or search(contact.last_name) or search(contact.phone_number))
+
+
+class DateEntry:
+    """The result of one date window, in (date, id) order."""
+
+    def __init__(self, field, start_date, end_date, contacts):
+        self.field = field
+        self.start_date = start_date
+        self.end_date = end_date
+        self.contacts = contacts
+        self.keys = [(getattr(contact, field), contact.contact_id) for contact in contacts]
+
+    def key(self, contact):
+        return getattr(contact, self.field), contact.contact_id
+
+    def matches(self, contact):
+        return self.start_date <= getattr(contact, self.field) <= self.end_date
+
+
+class QueryCache:
+    """
+    Query key -> result entry, least recently used first out.
+
+    Bounded by the number of entries and by the number of contacts over all entries.
+    """
+
+    def __init__(self, fields, max_entries=DEFAULT_MAX_ENTRIES, max_results=DEFAULT_MAX_RESULTS):
+        # an update which changes none of the fields leaves the cached results alone
+        self.fields = fields
+        self.max_entries = max_entries
+        self.max_results = max_results
+        self.entries = collections.OrderedDict()
+        self.results = 0
+        self.hits = 0
+        self.misses = 0
+        # the PhoneBook generation the entries are up to date with
+        self.generation = 0
+        # the server mode runs reads in parallel threads
+        self._lock = threading.Lock()
+
+    def get(self, key, generation):
+        """The cached contacts for key, or None."""
+        with self._lock:
+            if generation != self.generation:
+                self._clear()
+                self.generation = generation
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.contacts
+
+    def put(self, key, entry, generation):
+        """Cache entry for key, unless the book changed since the result was computed or it's too large."""
+        with self._lock:
+            if generation != self.generation or len(entry.contacts) > self.max_results or not self.max_entries:
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.results -= len(old.contacts)
+            self.entries[key] = entry
+            self.results += len(entry.contacts)
+            while len(self.entries) > self.max_entries or self.results > self.max_results:
+                _, evicted = self.entries.popitem(last=False)
+                self.results -= len(evicted.contacts)
+
+    def advance(self, generation):
+        """The entries have been kept up to date (through add/remove) with the book at generation."""
+        self.generation = generation
+
+    def _clear(self):
+        self.entries.clear()
+        self.results = 0
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    # index protocol, called by PhoneBook with the old values before a change and the new ones after it
+
+    def add(self, contact):
+        with self._lock:
+            for entry in self.entries.values():
+                if entry.matches(contact):
+                    key = entry.key(contact)
+                    i = bisect.bisect_left(entry.keys, key)
+                    if i == len(entry.keys) or entry.keys[i] != key:
+                        entry.keys.insert(i, key)
+                        entry.contacts.insert(i, contact)
+                        self.results += 1
+
+    def remove(self, contact):
+        with self._lock:
+            for entry in self.entries.values():
+                key = entry.key(contact)
+                i = bisect.bisect_left(entry.keys, key)
+                if i < len(entry.keys) and entry.keys[i] == key:
+                    del entry.keys[i]
+                    del entry.contacts[i]
+                    self.results -= 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries), 'results': self.results}
+
+
+def search_cache(max_entries=DEFAULT_MAX_ENTRIES, max_results=DEFAULT_MAX_RESULTS):
+    return QueryCache(TrigramIndex.FIELDS, max_entries, max_results)
+
+
+def date_cache(max_entries=DEFAULT_MAX_ENTRIES, max_results=DEFAULT_MAX_RESULTS):
+    return QueryCache(('created_at', 'updated_at'), max_entries, max_results)
+
+
+def search_key(query):
+    """Searches ignore case, so plain and wildcard queries which only differ in case share an entry."""
+    return query.lower() if literal_fragments(query) is not None else query
@@ -0,0 +1,148 @@
+"""
+Rendering contacts for the CLI: formatted a page at a time into one buffered write, and a pager to move through
+large results (next/prev/jump) which only reads the pages it shows.
+"""
+import sys
+
+DEFAULT_PAGE_SIZE = 20
+# without the pager, contacts are still written out this many at a time
+WRITE_BATCH = 1_000
+
+
+def format_time(value):
+    # same text as strftime('%Y-%m-%d %H:%M:%S'), several times faster
+    return value.isoformat(' ', 'seconds')
+
+
+def format_contact(contact):
+    """One contact as the text block the CLI shows."""
+    text = (f"\n---------------------\n"
+            f"Contact ID: {contact.contact_id} \n"
+            f"Name: {contact.first_name} {contact.last_name}\n"
+            f"Phone: {contact.phone_number}\n")
+    if contact.email_address:
+        text += f"Email: {contact.email_address}\n"
+    if contact.address:
+        text += f"Address: {contact.address}\n"
+    return text + (f"Created At: {format_time(contact.created_at)}\n"
+                   f"Updated At: {format_time(contact.updated_at)}\n")
+
+
+def format_item(item):
+    """Contacts are formatted, plain strings (e.g. group headings) are shown as they are."""
+    return item if isinstance(item, str) else format_contact(item)
+
+
+def write_page(items, out=None):
+    """Format items and write them with a single write call."""
+    out = out or sys.stdout
+    out.write(''.join(map(format_item, items)))
+    out.flush()
+
+
+def write_contacts(contacts, out=None):
+    """Write every contact of an iterable, read lazily WRITE_BATCH at a time."""
+    out = out or sys.stdout
+    batch = []
+    written = 0
+    for contact in contacts:
+        batch.append(contact)
+        if len(batch) >= WRITE_BATCH:
+            write_page(batch, out)
+            written += len(batch)
+            batch = []
+    if batch:
+        write_page(batch, out)
+        written += len(batch)
+    if not written:
+        out.write("No contacts found.\n")
+        out.flush()
+    return written
+
+
+class Pager:
+    """
+    Interactive pages over a result, commands: Enter/n next, p previous, a page number (or j N) to jump, q quit.
+
+    The result is either a fetch(offset, limit) function for sources with random access (e.g. PhoneBook.iter_sorted),
+    with total its size when known, or any iterable (see Pager.of), which is read lazily; pages already read are
+    kept so they can be shown again, but nothing past the furthest page shown is read.
+    """
+
+    def __init__(self, fetch, total=None, page_size=DEFAULT_PAGE_SIZE, out=None, read=input):
+        self.fetch = fetch
+        self.total = total
+        self.page_size = page_size
+        self.out = out or sys.stdout
+        self.read = read
+
+    @classmethod
+    def of(cls, items, **kwargs):
+        """Pager over an iterable; lists and tuples are sliced, anything else is consumed as pages are shown."""
+        if isinstance(items, (list, tuple)):
+            return cls(lambda offset, limit: items[offset:offset + limit], total=len(items), **kwargs)
+        iterator = iter(items)
+        seen = []
+
+        def fetch(offset, limit):
+            while len(seen) < offset + limit:
+                item = next(iterator, _END)
+                if item is _END:
+                    break
+                seen.append(item)
+            return seen[offset:offset + limit]
+
+        return cls(fetch, **kwargs)
+
+    @property
+    def pages(self):
+        return None if self.total is None else max(1, -(-self.total // self.page_size))
+
+    def page(self, number):
+        """The items of page number (from 1), [] past the end."""
+        return list(self.fetch((number - 1) * self.page_size, self.page_size))
+
+    def run(self):
+        """Show pages until the user quits or leaves the last one, returns the number of pages shown."""
+        number = 1
+        items = self.page(number)
+        if not items:
+            self.out.write("No contacts found.\n")
+            self.out.flush()
+            return 0
+        shown = 0
+        while True:
+            write_page(items, self.out)
+            shown += 1
+            # a short page is the last one, even when the total isn't known
+            last = len(items) < self.page_size or (self.pages is not None and number >= self.pages)
+            if last and number == 1:
+                return shown
+            of_pages = f" of {self.pages}" if self.pages is not None else (" (last)" if last else "")
+            command = self.read(f"\n-- Page {number}{of_pages} -- [n]ext, [p]rev, [j]ump <page>, [q]uit: ")
+            command = command.strip().lower()
+            if command in ('q', 'quit'):
+                return shown
+            if command in ('', 'n', 'next'):
+                target = number + 1
+            elif command in ('p', 'prev'):
+                target = max(1, number - 1)
+            else:
+                page = command[1:].strip() if command.startswith('j') else command
+                if not page.isdigit() or int(page) < 1:
+                    self.out.write("Invalid command.\n")
+                    target = number
+                else:
+                    target = int(page)
+            if target != number:
+                target_items = self.page(target)
+                if not target_items:
+                    if command in ('', 'n', 'next'):
+                        return shown
+                    self.out.write(f"There is no page {target}.\n")
+                    target = number
+                else:
+                    number, items = target, target_items
+
+
+_END = object()
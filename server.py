@@ -0,0 +1,427 @@
+"""
+Local HTTP/JSON API over a PhoneBook, run with `python3 main.py --serve`.
+
+    GET    /contacts?offset=&limit=&initial=      contacts in alphabetical order (streamed)
+    POST   /contacts                              create, the body is a JSON object with the contact fields
+    GET    /contacts/<id>                         one contact
+    PATCH  /contacts/<id>                         update, the body is a JSON object {field: new value}
+    DELETE /contacts/<id>                         delete
+    GET    /contacts/<id>/history                 change history of a contact
+    GET    /search?q=<regex>                      search_contacts (streamed)
+    GET    /dates?start=&end=&field=created_at    contacts by date, ISO times (streamed)
+    GET    /groups                                {initial: number of contacts}
+    GET    /groups/<initial>?offset=&limit=       one group in alphabetical order (streamed)
+
+PhoneBook calls are blocking, they run in a thread pool so the event loop keeps serving other connections.
+An asyncio reader-writer lock lets any number of reads run together while mutations run one at a time
+(a waiting writer stops new readers from starting, so writers aren't starved). Large results are sent
+with chunked encoding a batch at a time, and the book is saved in the background every save_interval seconds
+when it changed (every mutation is journaled as it happens, the save only compacts the journal).
+"""
+import asyncio
+import concurrent.futures
+import datetime
+import json
+import re
+import urllib.parse
+
+from contact import Contact
+import log_pipeline
+import utils
+
+logger = log_pipeline.get_logger('server')
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_SAVE_INTERVAL = 5.0
+# contacts per chunk of a streamed response
+STREAM_BATCH = 500
+MAX_BODY = 1 << 20
+# fields a body may set to null, the others must be strings
+OPTIONAL_FIELDS = ('email_address', 'address')
+REASONS = {200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ReadWriteLock:
+    """asyncio reader-writer lock: shared reads, exclusive writes, waiting writers go first."""
+
+    def __init__(self):
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire_read(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+
+    async def release_read(self):
+        async with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    async def acquire_write(self):
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writer and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    async def release_write(self):
+        async with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    def reading(self):
+        return _Held(self.acquire_read, self.release_read)
+
+    def writing(self):
+        return _Held(self.acquire_write, self.release_write)
+
+
+class _Held:
+
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    async def __aenter__(self):
+        await self._acquire()
+
+    async def __aexit__(self, *exc_info):
+        await self._release()
+
+
+def contact_json(contact):
+    return json.dumps(contact.to_dict(), default=str)
+
+
+def _int_param(params, name, default=None, minimum=None):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer")
+    if minimum is not None and value < minimum:
+        raise HTTPError(400, f"{name} must be at least {minimum}")
+    return value
+
+
+def _time_param(params, name):
+    if name not in params:
+        raise HTTPError(400, f"{name} is required")
+    try:
+        return datetime.datetime.fromisoformat(params[name])
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an ISO time (yyyy-mm-dd hh:mm:ss)")
+
+
+class PhoneBookServer:
+
+    def __init__(self, phone_book, host=DEFAULT_HOST, port=DEFAULT_PORT, save_interval=DEFAULT_SAVE_INTERVAL,
+                 workers=None):
+        self.phone_book = phone_book
+        self.host = host
+        self.port = port
+        self.save_interval = save_interval
+        self.lock = ReadWriteLock()
+        # one sqlite connection can't run queries from several threads at once
+        self.executor = concurrent.futures.ThreadPoolExecutor(1 if phone_book.storage == 'sqlite' else workers)
+        # mutations since the last background save
+        self.dirty = 0
+        self._server = None
+        self._saver = None
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def read(self, func, *args):
+        async with self.lock.reading():
+            return await self._call(func, *args)
+
+    async def write(self, func, *args):
+        async with self.lock.writing():
+            result = await self._call(func, *args)
+            self.dirty += 1
+            return result
+
+    # connection handling
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ')
+                except ValueError:
+                    await self._send(writer, 400, {'error': 'malformed request line'}, keep_alive=False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY:
+                    await self._send(writer, 413, {'error': 'request body too large'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                await self.dispatch(writer, method, target, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, writer, method, target, body, keep_alive):
+        url = urllib.parse.urlsplit(target)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            result = await self.route(writer, method, parts, params, body, keep_alive)
+            if result is not None:
+                status, payload = result
+                await self._send(writer, status, payload, keep_alive)
+        except ConnectionError:
+            raise
+        except HTTPError as error:
+            await self._send(writer, error.status, {'error': str(error)}, keep_alive)
+        except (ValueError, re.error) as error:
+            # validation errors from the phone book, or a bad search regex
+            await self._send(writer, 400, {'error': str(error)}, keep_alive)
+        except Exception:
+            logger.exception("Request %s %s failed", method, target)
+            await self._send(writer, 500, {'error': 'internal error'}, keep_alive)
+
+    async def route(self, writer, method, parts, params, body, keep_alive):
+        """Run one request, returns (status, JSON payload) or None when the response was streamed."""
+        phone_book = self.phone_book
+        if parts == ['contacts']:
+            if method == 'GET':
+                offset = _int_param(params, 'offset', 0, minimum=0)
+                limit = _int_param(params, 'limit', minimum=1)
+                initial = params.get('initial', '').upper() or None
+                return await self._stream(writer, phone_book.iter_sorted(offset, limit, initial), keep_alive)
+            if method == 'POST':
+                return 201, await self.write(self._create, self._json_body(body))
+        elif len(parts) >= 2 and parts[0] == 'contacts':
+            contact_id = _int_param({'id': parts[1]}, 'id')
+            if len(parts) == 3 and parts[2] == 'history' and method == 'GET':
+                contact = await self.read(phone_book.get_contact_by_id, contact_id)
+                if contact is None:
+                    raise HTTPError(404, f"No contact found with ID {contact_id}")
+                return 200, await self.read(phone_book.get_contact_history, contact_id)
+            if len(parts) == 2:
+                if method == 'GET':
+                    return 200, await self.read(self._get, contact_id)
+                if method == 'PATCH':
+                    return 200, await self.write(self._update, contact_id, self._json_body(body))
+                if method == 'DELETE':
+                    await self.write(self._delete, contact_id)
+                    return 204, None
+        elif parts == ['search'] and method == 'GET':
+            if 'q' not in params:
+                raise HTTPError(400, "q is required")
+            return await self._stream(writer, lambda: iter(phone_book.search_contacts(params['q'])), keep_alive)
+        elif parts == ['dates'] and method == 'GET':
+            start, end = _time_param(params, 'start'), _time_param(params, 'end')
+            field = params.get('field', 'created_at')
+            if field not in ('created_at', 'updated_at'):
+                raise HTTPError(400, "field must be created_at or updated_at")
+            return await self._stream(writer, phone_book.iter_contacts_by_date(start, end, field), keep_alive)
+        elif parts == ['groups'] and method == 'GET':
+            return 200, await self.read(phone_book.group_counts)
+        elif len(parts) == 2 and parts[0] == 'groups' and method == 'GET':
+            offset = _int_param(params, 'offset', 0, minimum=0)
+            limit = _int_param(params, 'limit', minimum=1)
+            return await self._stream(writer, phone_book.iter_sorted(offset, limit, parts[1].upper()), keep_alive)
+        else:
+            raise HTTPError(404, "no such resource")
+        raise HTTPError(405, f"{method} is not allowed here")
+
+    @staticmethod
+    def _json_body(body):
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(400, "the body must be JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "the body must be a JSON object")
+        return data
+
+    @staticmethod
+    def _check_types(data):
+        """Contact fields are strings (or null for the optional ones), anything else is a bad request."""
+        for field, value in data.items():
+            if not isinstance(value, str) and not (value is None and field in OPTIONAL_FIELDS):
+                raise HTTPError(400, f"{field} must be a string")
+
+    # blocking PhoneBook calls, run in the executor
+
+    def _get(self, contact_id):
+        contact = self.phone_book.get_contact_by_id(contact_id)
+        if contact is None:
+            raise HTTPError(404, f"No contact found with ID {contact_id}")
+        return contact.to_dict()
+
+    def _create(self, data):
+        unknown = set(data) - set(self.phone_book.UPDATABLE_FIELDS)
+        if unknown:
+            raise HTTPError(400, f"unknown fields {sorted(unknown)}")
+        self._check_types(data)
+        for field in ('first_name', 'last_name', 'phone_number'):
+            if not data.get(field):
+                raise HTTPError(400, f"{field} is required")
+        # validate before taking an id, a rejected contact doesn't use one up
+        mask = utils.validate_many([data['phone_number']], [data.get('email_address')])[0]
+        if mask:
+            raise HTTPError(400, utils.error_mask_message(mask))
+        contact = Contact(self.phone_book.get_next_contact_id(), **data, validate=False)
+        self.phone_book.add_contact(contact)
+        return contact.to_dict()
+
+    def _update(self, contact_id, data):
+        contact = self.phone_book.get_contact_by_id(contact_id)
+        if contact is None:
+            raise HTTPError(404, f"No contact found with ID {contact_id}")
+        self._check_types(data)
+        # bulk_update validates the fields (unknown, empty, phone and email) before changing anything
+        self.phone_book.bulk_update([(contact_id, data)])
+        return self.phone_book.get_contact_by_id(contact_id).to_dict()
+
+    def _delete(self, contact_id):
+        contact = self.phone_book.get_contact_by_id(contact_id)
+        if contact is None:
+            raise HTTPError(404, f"No contact found with ID {contact_id}")
+        self.phone_book.delete_contact(contact)
+
+    # responses
+
+    async def _send(self, writer, status, payload, keep_alive):
+        body = b'' if payload is None else json.dumps(payload, default=str).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def _stream(self, writer, contacts, keep_alive):
+        """
+        Send contacts as one JSON array in chunked encoding, STREAM_BATCH contacts per chunk.
+
+        contacts is a lazy iterator (or a function returning one); the read lock is held until the last
+        chunk is out, so a mutation can't change the book under the iterator.
+        """
+        async with self.lock.reading():
+            iterator = await self._call(contacts) if callable(contacts) else contacts
+            head = (f"HTTP/1.1 200 OK\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Transfer-Encoding: chunked\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+            writer.write(head.encode('latin-1'))
+            separator = '['
+            try:
+                while True:
+                    batch = await self._call(self._next_batch, iterator)
+                    if not batch:
+                        break
+                    chunk = (separator + ','.join(batch)).encode('utf-8')
+                    separator = ','
+                    writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                    await writer.drain()
+            except Exception:
+                # the status line is already out, all we can do is cut the response short
+                logger.exception("Streaming a response failed")
+                writer.close()
+                raise ConnectionError("response aborted")
+            chunk = b'[]' if separator == '[' else b']'
+            writer.write(b'%x\r\n%s\r\n0\r\n\r\n' % (len(chunk), chunk))
+            await writer.drain()
+
+    @staticmethod
+    def _next_batch(iterator):
+        batch = []
+        for contact in iterator:
+            batch.append(contact_json(contact))
+            if len(batch) == STREAM_BATCH:
+                break
+        return batch
+
+    # background persistence
+
+    async def _save_periodically(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            await self.save()
+
+    async def save(self):
+        """Save the book if it changed, readers keep going while it is written."""
+        if not self.dirty:
+            return
+        async with self.lock.reading():
+            self.dirty = 0
+            try:
+                await self._call(self.phone_book.save_contacts)
+            except Exception:
+                logger.exception("Background save failed")
+
+    def _build_indexes(self):
+        # the indexes are built by the first query which needs them, do it before the first requests come in
+        # instead of letting a burst of concurrent requests all build them at once
+        phone_book = self.phone_book
+        phone_book.search_contacts('^$')
+        next(phone_book.iter_sorted(limit=1), None)
+        for field in ('created_at', 'updated_at'):
+            next(phone_book.iter_contacts_by_date(datetime.datetime.min, datetime.datetime.min, field), None)
+
+    async def start(self):
+        await self._call(self._build_indexes)
+        self._server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._saver = asyncio.create_task(self._save_periodically())
+        logger.info("Serving the phone book on http://%s:%d", self.host, self.port)
+
+    async def stop(self):
+        self._saver.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+        await self.save()
+        self.executor.shutdown()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def run(phone_book, host=DEFAULT_HOST, port=DEFAULT_PORT, save_interval=DEFAULT_SAVE_INTERVAL):
+    """Serve phone_book until interrupted (Ctrl+C), then save it."""
+    server = PhoneBookServer(phone_book, host, port, save_interval)
+    print(f"Serving the phone book on http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
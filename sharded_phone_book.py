@@ -0,0 +1,344 @@
+"""
+Sharded PhoneBook: contacts partitioned by id across worker processes, so scans use every core.
+
+Contact id % shards picks the owning shard. Every shard process holds a regular in-memory PhoneBook with
+its slice (and its own indexes); single contact reads and writes go to the owning shard only, scans (regex
+search, date filter, sorted views, group counts) are sent to all shards at once and their results merged,
+with a k-way merge (heapq.merge) where the output is ordered.
+
+The parent process keeps the persistence: the contacts file, journal and history store of a regular
+PhoneBook (same formats, a sharded book can be opened as a plain one and back), the shards only hold memory.
+Shards are started with the 'spawn' method and talk over pipes (results are pickled), there is no shared memory.
+
+Operations which need the whole book at once (batch_import, bulk_update, export_contacts, query, find_duplicates)
+are not spread over the shards: the parent's PhoneBook runs them on every contact, gathered from the shards, and
+hands the shards their slices again when the book changed, which costs a round trip of the whole book.
+It doesn't cover the rest of the PhoneBook API: no autosave (start_autosave), sqlite or columns storage,
+cache_stats or metrics, so main.py and the server keep using PhoneBook.
+"""
+import heapq
+import logging
+import multiprocessing
+import os
+
+import dedup
+import importer
+import log_pipeline
+import query_cache
+from phone_book import PhoneBook
+
+logger = log_pipeline.get_logger('shards')
+
+
+def _name_key(contact):
+    return contact.last_name, contact.first_name, contact.contact_id
+
+
+class _Shard:
+    """The operations a shard process runs on its slice, called by name from ShardedPhoneBook."""
+
+    def __init__(self, cache_size=query_cache.DEFAULT_MAX_ENTRIES):
+        # shards log nothing worth keeping: with a handler on the root logger already, PhoneBook doesn't start
+        # a log writer thread of its own on logs/phone_book.log (see log_pipeline.setup_logging)
+        logging.getLogger().addHandler(logging.NullHandler())
+        # memory only, the parent persists the book
+        self.phone_book = PhoneBook(os.devnull, history_file=os.devnull, cache_size=cache_size)
+
+    def load(self, contacts):
+        self.phone_book.contacts = contacts
+
+    def contacts(self):
+        return self.phone_book.contacts
+
+    def count(self):
+        return len(self.phone_book)
+
+    def max_id(self):
+        return max(self.phone_book._contacts, default=0)
+
+    def get(self, contact_id):
+        return self.phone_book.get_contact_by_id(contact_id)
+
+    def add(self, contact):
+        self.phone_book.add_contact(contact)
+
+    def update(self, contact_id, fields):
+        """Returns the updated contact and the applied (field, old, new) changes."""
+        contact = self.phone_book.get_contact_by_id(contact_id)
+        if contact is None:
+            raise ValueError(f"No contact found with ID {contact_id}")
+        changes = [(field, getattr(contact, field), value) for field, value in fields.items()
+                   if hasattr(contact, field)]
+        self.phone_book.update_contact(contact, log=False, **fields)
+        return contact, changes
+
+    def delete(self, contact_ids):
+        return self.phone_book.delete_contacts(contact_ids)
+
+    def search(self, query):
+        return self.phone_book.search_contacts(query)
+
+    def lookup_by_phones(self, phone_numbers):
+        return self.phone_book.lookup_by_phones(phone_numbers)
+
+    def by_date(self, start_date, end_date, field):
+        return list(self.phone_book.iter_contacts_by_date(start_date, end_date, field))
+
+    def sorted(self, limit, initial):
+        return list(self.phone_book.iter_sorted(0, limit, initial))
+
+    def group_counts(self):
+        return self.phone_book.group_counts()
+
+
+def _serve_shard(connection, cache_size):
+    """Shard process main loop: (method, args) in, ('ok', result) or ('error', exception) out, None stops it."""
+    shard = _Shard(cache_size)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        method, args = request
+        try:
+            connection.send(('ok', getattr(shard, method)(*args)))
+        except Exception as error:
+            connection.send(('error', error))
+    connection.close()
+
+
+class ShardedPhoneBook:
+
+    def __init__(self, contacts_file='data/contacts.json', shards=None, journal_file=None, history_file=None,
+                 compact_every=PhoneBook.DEFAULT_COMPACT_EVERY, cache_size=query_cache.DEFAULT_MAX_ENTRIES):
+        self.shards = shards or os.cpu_count()
+        # a regular, memory-less PhoneBook for the files: load, save, journal and history
+        # (its own _persist must never run, it would save the empty book, see _persist below)
+        self._book = PhoneBook(contacts_file, journal_file=journal_file, history_file=history_file,
+                               compact_every=compact_every)
+        context = multiprocessing.get_context('spawn')
+        self._connections = []
+        self._processes = []
+        for _ in range(self.shards):
+            parent_end, child_end = context.Pipe()
+            process = context.Process(target=_serve_shard, args=(child_end, cache_size), daemon=True)
+            process.start()
+            child_end.close()
+            self._connections.append(parent_end)
+            self._processes.append(process)
+        self.next_id = 1
+
+    # talking to the shards
+
+    def _shard_of(self, contact_id):
+        return contact_id % self.shards
+
+    @staticmethod
+    def _receive(connection):
+        status, result = connection.recv()
+        if status == 'error':
+            raise result
+        return result
+
+    def _call(self, shard, method, *args):
+        connection = self._connections[shard]
+        connection.send((method, args))
+        return self._receive(connection)
+
+    def _fan_out(self, method, *args, per_shard=None):
+        """Run method on every shard in parallel, per_shard gives shard-specific arguments; results by shard."""
+        for shard, connection in enumerate(self._connections):
+            connection.send((method, per_shard[shard] if per_shard is not None else args))
+        return [self._receive(connection) for connection in self._connections]
+
+    def close(self):
+        for connection in self._connections:
+            connection.send(None)
+            connection.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # loading and saving
+
+    @property
+    def contacts(self):
+        return sorted((contact for part in self._fan_out('contacts') for contact in part),
+                      key=lambda contact: contact.contact_id)
+
+    @contacts.setter
+    def contacts(self, contacts):
+        slices = [[] for _ in range(self.shards)]
+        for contact in contacts:
+            slices[self._shard_of(contact.contact_id)].append(contact)
+        self._fan_out('load', per_shard=[(part,) for part in slices])
+        self.update_next_id()
+
+    def load_contacts(self):
+        """Load the contacts file (and replay the journal) in the parent, then hand every shard its slice."""
+        self._book.load_contacts()
+        self.contacts = self._book.contacts
+        self._book.contacts = []
+
+    def save_contacts(self):
+        self._book.contacts = self.contacts
+        self._book.save_contacts()
+        self._book.contacts = []
+
+    def _persist(self):
+        """Called after every mutation: compact the journal when it's due, with the contacts of the shards."""
+        self._book.generation += 1
+        journal = self._book.journal
+        if journal is not None and journal.records >= self._book.compact_every:
+            self.save_contacts()
+
+    def update_next_id(self):
+        self.next_id = max(self._fan_out('max_id'), default=0) + 1
+
+    def get_next_contact_id(self):
+        contact_id = self.next_id
+        self.next_id += 1
+        return contact_id
+
+    def __len__(self):
+        return sum(self._fan_out('count'))
+
+    # single contact operations, routed to the owning shard
+
+    def get_contact_by_id(self, contact_id):
+        return self._call(self._shard_of(contact_id), 'get', contact_id)
+
+    def get_contact_history(self, contact_id):
+        return self._book.get_contact_history(contact_id)
+
+    def add_contact(self, contact):
+        self._call(self._shard_of(contact.contact_id), 'add', contact)
+        self._book._journal({'op': 'add', 'contact': contact.to_dict()})
+        self._persist()
+
+    def update_contact(self, contact, **kwargs):
+        updated, changes = self._call(self._shard_of(contact.contact_id), 'update', contact.contact_id, kwargs)
+        # the caller's object is a copy, bring it up to date like a local update would
+        for field, _, value in changes:
+            setattr(contact, field, value)
+        contact._updated_at = updated._updated_at
+        self._book.history.append(contact.contact_id, updated.updated_at, changes)
+        self._book._journal({'op': 'update', 'id': contact.contact_id, 'at': updated.updated_at, 'fields': kwargs})
+        self._persist()
+
+    def delete_contact(self, contact):
+        self.delete_contacts([contact.contact_id])
+
+    def delete_contacts(self, contact_ids):
+        by_shard = [[] for _ in range(self.shards)]
+        for contact_id in contact_ids:
+            by_shard[self._shard_of(contact_id)].append(contact_id)
+        deleted = [contact for part in self._fan_out('delete', per_shard=[(ids,) for ids in by_shard])
+                   for contact in part]
+        if deleted:
+            deleted_ids = [contact.contact_id for contact in deleted]
+            self._book.history.forget(deleted_ids)
+            self._book._journal({'op': 'delete', 'ids': deleted_ids})
+        self._persist()
+        return deleted
+
+    # scans, fanned out to every shard and merged
+
+    def search_contacts(self, query):
+        """Same results as PhoneBook.search_contacts, in id order."""
+        # every shard's results are in id order already
+        return list(heapq.merge(*self._fan_out('search', query), key=lambda contact: contact.contact_id))
+
+    def lookup_by_phones(self, phone_numbers):
+        """Same results as PhoneBook.lookup_by_phones, contacts aren't sharded by phone so every shard is asked."""
+        parts = self._fan_out('lookup_by_phones', list(phone_numbers))
+        return [sorted((contact for part in found for contact in part), key=lambda contact: contact.contact_id)
+                for found in zip(*parts)]
+
+    def lookup_by_phone(self, phone_number):
+        return self.lookup_by_phones([phone_number])[0]
+
+    def iter_contacts_by_date(self, start_date, end_date, field='created_at'):
+        return heapq.merge(*self._fan_out('by_date', start_date, end_date, field),
+                           key=lambda contact: (getattr(contact, field), contact.contact_id))
+
+    def filter_contacts_by_date(self, start_date, end_date):
+        return list(self.iter_contacts_by_date(start_date, end_date))
+
+    def iter_sorted(self, offset=0, limit=None, initial=None):
+        # every shard sends its first offset + limit contacts, the merge skips the first offset of them
+        per_shard = None if limit is None else offset + limit
+        merged = heapq.merge(*self._fan_out('sorted', per_shard, initial), key=_name_key)
+        for i, contact in enumerate(merged):
+            if limit is not None and i >= offset + limit:
+                break
+            if i >= offset:
+                yield contact
+
+    def sorted_page(self, page, page_size=PhoneBook.DEFAULT_PAGE_SIZE, initial=None):
+        return list(self.iter_sorted((page - 1) * page_size, page_size, initial))
+
+    def group_counts(self):
+        counts = {}
+        for part in self._fan_out('group_counts'):
+            for initial, count in part.items():
+                counts[initial] = counts.get(initial, 0) + count
+        return dict(sorted(counts.items()))
+
+    def sort_contacts(self):
+        return list(self.iter_sorted())
+
+    def group_contacts(self):
+        return {initial: list(self.iter_sorted(initial=initial)) for initial in self.group_counts()}
+
+    # whole-book operations, run by the parent's PhoneBook on the contacts of every shard
+
+    def _gather(self):
+        self._book.contacts = self.contacts
+        self._book.next_id = self.next_id
+
+    def _scatter(self):
+        """Hand the shards their slices of the parent's book after it changed, and empty it."""
+        next_id = self._book.next_id
+        self.contacts = self._book.contacts
+        self._book.contacts = []
+        self.next_id = max(self.next_id, next_id)
+
+    def batch_import(self, csv_file_path, chunk_size=importer.DEFAULT_CHUNK_SIZE, workers=None, error_file=None,
+                     dedup_mode=None):
+        """Same as PhoneBook.batch_import (journal and history included), then the shards get the new contacts."""
+        self._gather()
+        try:
+            return self._book.batch_import(csv_file_path, chunk_size, workers, error_file, dedup_mode)
+        finally:
+            self._scatter()
+
+    def bulk_update(self, changes):
+        """Same as PhoneBook.bulk_update, all or nothing across the shards."""
+        self._gather()
+        try:
+            return self._book.bulk_update(changes)
+        finally:
+            self._scatter()
+
+    def export_contacts(self, path, fields=None, query=None, start_date=None, end_date=None, date_field='updated_at'):
+        """Same as PhoneBook.export_contacts, the whole book is held by the parent while it is written."""
+        self._gather()
+        try:
+            return self._book.export_contacts(path, fields, query, start_date, end_date, date_field)
+        finally:
+            self._book.contacts = []
+
+    def query(self):
+        """A Query (see query.py) over a copy of the book as it is now, run in the parent."""
+        phone_book = PhoneBook(os.devnull, history_file=os.devnull, cache_size=0)
+        phone_book.contacts = self.contacts
+        return phone_book.query()
+
+    def find_duplicates(self):
+        return dedup.find_duplicates(self.contacts)
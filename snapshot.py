@@ -0,0 +1,154 @@
+"""
+Binary snapshot format for the contacts file, read lazily through mmap.
+
+Layout (little endian):
+    header      MAGIC
+    records     per contact: u32 length, then i64 id, i64 created_at, i64 updated_at (epoch microseconds),
+                then first_name, last_name, phone_number, email_address, address and the history,
+                each a u32 length (NONE_LENGTH for None) followed by utf-8 bytes;
+                history is always None now (see history_store.py), the slot keeps older snapshots readable
+    id table    count x i64 contact ids
+    offsets     count x u64 record offsets, in the same order
+    footer      u64 count, u64 offset of the id table, MAGIC
+
+Records were validated before they were written, so loading skips validation and timestamp parsing,
+and a contact is only decoded when it is first accessed.
+"""
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import MutableMapping
+
+from contact import Contact
+
+MAGIC = b'PBSNAP01'
+SUFFIX = '.pbsnap'
+LENGTH = struct.Struct('<I')
+NONE_LENGTH = 0xFFFFFFFF
+RECORD_HEADER = struct.Struct('<qqq')
+FOOTER = struct.Struct('<QQ8s')
+STRING_FIELDS = ('first_name', 'last_name', 'phone_number', 'email_address', 'address')
+
+
+def _encode_value(value):
+    if value is None:
+        return LENGTH.pack(NONE_LENGTH)
+    data = value.encode('utf-8')
+    return LENGTH.pack(len(data)) + data
+
+
+def encode_contact(contact):
+    """Encode one contact as a length-prefixed record."""
+    parts = [RECORD_HEADER.pack(contact.contact_id, contact._created_at, contact._updated_at)]
+    parts.extend(_encode_value(getattr(contact, name)) for name in STRING_FIELDS)
+    parts.append(_encode_value(None))
+    body = b''.join(parts)
+    return LENGTH.pack(len(body)) + body
+
+
+def decode_contact(buffer, offset):
+    """Decode the record at offset back into a Contact, without validating it again."""
+    pos = offset + LENGTH.size
+    contact_id, created_at, updated_at = RECORD_HEADER.unpack_from(buffer, pos)
+    pos += RECORD_HEADER.size
+    values = []
+    for _ in range(len(STRING_FIELDS) + 1):
+        (length,) = LENGTH.unpack_from(buffer, pos)
+        pos += LENGTH.size
+        if length == NONE_LENGTH:
+            values.append(None)
+        else:
+            values.append(buffer[pos:pos + length].decode('utf-8'))
+            pos += length
+    values.pop()
+    return Contact.from_compact(contact_id, *values, created_at, updated_at)
+
+
+def record_at(buffer, offset):
+    """The raw bytes of the record at offset, length prefix included."""
+    (length,) = LENGTH.unpack_from(buffer, offset)
+    return buffer[offset:offset + LENGTH.size + length]
+
+
+def write_snapshot(path, records):
+    """
+    Write a snapshot atomically (temp file + rename).
+
+    records yields (contact_id, contact) pairs, where contact may also be an already-encoded record (bytes),
+    which is copied as is, so contacts that were never accessed don't need to be decoded to be saved again.
+    """
+    ids = array('q')
+    offsets = array('Q')
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC)
+        offset = len(MAGIC)
+        for contact_id, contact in records:
+            data = contact if isinstance(contact, bytes) else encode_contact(contact)
+            ids.append(contact_id)
+            offsets.append(offset)
+            file.write(data)
+            offset += len(data)
+        file.write(ids.tobytes())
+        file.write(offsets.tobytes())
+        file.write(FOOTER.pack(len(ids), offset, MAGIC))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+class LazyContacts(MutableMapping):
+    """
+    id -> Contact mapping over a mapped snapshot file.
+
+    Entries hold the record offset until the contact is first read, then the decoded Contact.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) \
+                if os.fstat(file.fileno()).st_size else b''
+        if len(self._buffer) < len(MAGIC) + FOOTER.size or self._buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a contacts snapshot")
+        count, table_offset, magic = FOOTER.unpack_from(self._buffer, len(self._buffer) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is truncated")
+        ids = array('q')
+        ids.frombytes(self._buffer[table_offset:table_offset + 8 * count])
+        offsets = array('Q')
+        offsets.frombytes(self._buffer[table_offset + 8 * count:table_offset + 16 * count])
+        self._entries = dict(zip(ids, offsets))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __contains__(self, contact_id):
+        return contact_id in self._entries
+
+    def __getitem__(self, contact_id):
+        entry = self._entries[contact_id]
+        if type(entry) is int:
+            entry = self._entries[contact_id] = decode_contact(self._buffer, entry)
+        return entry
+
+    def __setitem__(self, contact_id, contact):
+        self._entries[contact_id] = contact
+
+    def __delitem__(self, contact_id):
+        del self._entries[contact_id]
+
+    def copy(self):
+        """Another mapping over the same file with a copy of the entries, contacts already decoded are shared."""
+        contacts = LazyContacts.__new__(LazyContacts)
+        contacts._buffer = self._buffer
+        contacts._entries = self._entries.copy()
+        return contacts
+
+    def records(self):
+        """(id, Contact or raw record bytes) pairs for write_snapshot, without decoding untouched contacts."""
+        for contact_id, entry in self._entries.items():
+            yield contact_id, record_at(self._buffer, entry) if type(entry) is int else entry
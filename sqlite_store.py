@@ -0,0 +1,253 @@
+"""
+SQLite storage for PhoneBook(storage='sqlite').
+
+Contacts live in a local database file instead of memory, so a book can be larger than RAM. The store is an
+id -> Contact mapping like the other storages, plus query methods PhoneBook pushes down to SQL: indexed date
+ranges, sorting and grouping streamed from cursors, and FTS5 (trigram tokenizer) for search_contacts.
+History is kept by the phone book's history store (see history_store.py), databases which still have
+a history table hand it over once through take_legacy_history.
+"""
+import re
+import sqlite3
+from collections.abc import MutableMapping
+
+from contact import Contact
+from indexes import literal_fragments
+import utils
+
+CONTACT_COLUMNS = ('id', 'first_name', 'last_name', 'phone_number', 'email_address', 'address',
+                   'created_at', 'updated_at')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    phone_number TEXT NOT NULL,
+    email_address TEXT,
+    address TEXT,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contacts_last_name ON contacts (last_name, first_name, id);
+CREATE INDEX IF NOT EXISTS contacts_phone_number ON contacts (phone_number);
+CREATE INDEX IF NOT EXISTS contacts_created_at ON contacts (created_at, id);
+CREATE INDEX IF NOT EXISTS contacts_updated_at ON contacts (updated_at, id);
+"""
+
+# external content FTS table, kept in sync with contacts by triggers
+FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5(
+    first_name, last_name, phone_number, content='contacts', content_rowid='id', tokenize='trigram'
+)
+"""
+FTS_TRIGGERS = {
+    'contacts_fts_insert': """
+CREATE TRIGGER IF NOT EXISTS contacts_fts_insert AFTER INSERT ON contacts BEGIN
+    INSERT INTO contacts_fts (rowid, first_name, last_name, phone_number)
+    VALUES (new.id, new.first_name, new.last_name, new.phone_number);
+END
+""",
+    'contacts_fts_delete': """
+CREATE TRIGGER IF NOT EXISTS contacts_fts_delete AFTER DELETE ON contacts BEGIN
+    INSERT INTO contacts_fts (contacts_fts, rowid, first_name, last_name, phone_number)
+    VALUES ('delete', old.id, old.first_name, old.last_name, old.phone_number);
+END
+""",
+    'contacts_fts_update': """
+CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE ON contacts BEGIN
+    INSERT INTO contacts_fts (contacts_fts, rowid, first_name, last_name, phone_number)
+    VALUES ('delete', old.id, old.first_name, old.last_name, old.phone_number);
+    INSERT INTO contacts_fts (rowid, first_name, last_name, phone_number)
+    VALUES (new.id, new.first_name, new.last_name, new.phone_number);
+END
+""",
+}
+
+
+def _regexp(pattern, value):
+    return value is not None and _compile(pattern).search(value) is not None
+
+
+_patterns = {}
+
+
+def _compile(pattern):
+    compiled = _patterns.get(pattern)
+    if compiled is None:
+        if len(_patterns) > 100:
+            _patterns.clear()
+        compiled = _patterns[pattern] = re.compile(pattern, re.IGNORECASE)
+    return compiled
+
+
+class SQLiteStore(MutableMapping):
+
+    def __init__(self, path):
+        self.path = path
+        # the server mode (server.py) runs queries from a worker thread, one at a time
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # WAL + synchronous=NORMAL: commits are durable against application crashes without an fsync each
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        try:
+            self.connection.execute(FTS_TABLE)
+            for trigger in FTS_TRIGGERS.values():
+                self.connection.execute(trigger)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer), searches scan instead
+            self.has_fts = False
+        self.connection.create_function('regexp', 2, _regexp, deterministic=True)
+        self.connection.commit()
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.connection.close()
+
+    # mapping API
+
+    def __len__(self):
+        return self.connection.execute('SELECT count(*) FROM contacts').fetchone()[0]
+
+    def __iter__(self):
+        for (contact_id,) in self.connection.execute('SELECT id FROM contacts ORDER BY id'):
+            yield contact_id
+
+    def __contains__(self, contact_id):
+        return self.connection.execute('SELECT 1 FROM contacts WHERE id = ?', (contact_id,)).fetchone() is not None
+
+    def __getitem__(self, contact_id):
+        for contact in self._query('c.id = ?', (contact_id,)):
+            return contact
+        raise KeyError(contact_id)
+
+    def __setitem__(self, contact_id, contact):
+        self.connection.execute(
+            f"INSERT INTO contacts ({', '.join(CONTACT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            f"ON CONFLICT (id) DO UPDATE SET "
+            f"{', '.join(f'{column} = excluded.{column}' for column in CONTACT_COLUMNS[1:])}",
+            self._row(contact_id, contact))
+
+    def __delitem__(self, contact_id):
+        cursor = self.connection.execute('DELETE FROM contacts WHERE id = ?', (contact_id,))
+        if not cursor.rowcount:
+            raise KeyError(contact_id)
+
+    def values(self):
+        return self._query()
+
+    def replace_all(self, contacts):
+        """Drop every contact and insert contacts instead, in one transaction."""
+        self.commit()
+        self.connection.execute('BEGIN')
+        if self.has_fts:
+            # indexing row by row through the triggers is much slower than rebuilding the FTS table once
+            for trigger in FTS_TRIGGERS:
+                self.connection.execute(f'DROP TRIGGER {trigger}')
+        self.connection.execute('DELETE FROM contacts')
+        rows = [self._row(contact.contact_id, contact) for contact in contacts]
+        self.connection.executemany(
+            f"INSERT INTO contacts ({', '.join(CONTACT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        if self.has_fts:
+            self.connection.execute("INSERT INTO contacts_fts (contacts_fts) VALUES ('rebuild')")
+            for trigger in FTS_TRIGGERS.values():
+                self.connection.execute(trigger)
+        self.commit()
+
+    def take_legacy_history(self):
+        """
+        History rows of databases written before the history store, as (contact id, timestamp, field, old, new)
+        tuples in the order they were written. The table is dropped afterwards, so this returns [] next time.
+        """
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history'").fetchone()
+        if not exists:
+            return []
+        rows = self.connection.execute('SELECT * FROM history ORDER BY rowid').fetchall()
+        self.connection.execute('DROP TABLE history')
+        return rows
+
+    def max_id(self):
+        return self.connection.execute('SELECT max(id) FROM contacts').fetchone()[0]
+
+    @staticmethod
+    def _row(contact_id, contact):
+        return (contact_id, contact.first_name, contact.last_name, contact.phone_number, contact.email_address,
+                contact.address, contact._created_at, contact._updated_at)
+
+    @staticmethod
+    def _select(where='', order_by='c.id', limit=None, offset=0):
+        sql = (f"SELECT {', '.join('c.' + column for column in CONTACT_COLUMNS)} FROM contacts c "
+               f"{'WHERE ' + where if where else ''} ORDER BY {order_by}")
+        if limit is not None or offset:
+            sql += f" LIMIT {-1 if limit is None else int(limit)} OFFSET {int(offset)}"
+        return sql
+
+    def _query(self, where='', params=(), order_by='c.id', limit=None, offset=0):
+        """Stream contacts matching where, ordered by order_by."""
+        for row in self.connection.execute(self._select(where, order_by, limit, offset), params):
+            yield Contact.from_compact(*row)
+
+    def explain(self, where='', params=(), order_by='c.id', limit=None, offset=0):
+        """SQLite's plan for a _query, as the detail lines of EXPLAIN QUERY PLAN."""
+        return [row[-1] for row in self.connection.execute(
+            'EXPLAIN QUERY PLAN ' + self._select(where, order_by, limit, offset), params)]
+
+    # queries pushed down from PhoneBook
+
+    def search(self, query):
+        """
+        Lazily yield the contacts whose first name, last name or phone number match the regex query, in id order.
+
+        Plain substring and wildcard queries go through the FTS5 trigram index (the regex then checks the
+        candidates as they are read), any other regex is evaluated by SQLite with a REGEXP function over the table.
+        Rows are streamed from the cursor, callers which need a list build one.
+        """
+        # compiled up front, so a bad regex raises re.error like the in-memory storages instead of failing in SQLite
+        pattern = _compile(query)
+        fragments = literal_fragments(query)
+        if self.has_fts and fragments and all(len(fragment) >= 3 for fragment in fragments):
+            match = ' AND '.join('"' + fragment.replace('"', '""') + '"' for fragment in fragments)
+            candidates = self._query('c.id IN (SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH ?)', (match,))
+            return (c for c in candidates
+                    if pattern.search(c.first_name) or pattern.search(c.last_name) or pattern.search(c.phone_number))
+        return self._query('c.first_name REGEXP ?1 OR c.last_name REGEXP ?1 OR c.phone_number REGEXP ?1', (query,))
+
+    def by_phone_numbers(self, phone_numbers):
+        """{phone number: contacts with it, in id order} for the given (formatted) phone numbers, via the phone index."""
+        found = {}
+        phone_numbers = list(dict.fromkeys(phone_numbers))
+        # stay well under SQLite's limit on bound parameters
+        for i in range(0, len(phone_numbers), 500):
+            chunk = phone_numbers[i:i + 500]
+            for contact in self._query(f"c.phone_number IN ({', '.join('?' * len(chunk))})", chunk):
+                found.setdefault(contact.phone_number, []).append(contact)
+        return found
+
+    def iter_by_date(self, start_date, end_date, field):
+        return self._query(f'c.{field} BETWEEN ? AND ?', (utils.to_epoch_us(start_date), utils.to_epoch_us(end_date)),
+                           order_by=f'c.{field}, c.id')
+
+    def iter_sorted(self, offset=0, limit=None, initial=None):
+        """Contacts in name order, optionally one page of them and only those whose last name starts with initial."""
+        where = 'upper(substr(last_name, 1, 1)) = ?' if initial else '1'
+        params = (initial,) if initial else ()
+        if not offset and limit is None:
+            return self._query(where.replace('last_name', 'c.last_name'), params,
+                               order_by='c.last_name, c.first_name, c.id')
+        return self._query(f'c.id IN (SELECT id FROM contacts WHERE {where} '
+                           f'ORDER BY last_name, first_name, id LIMIT ? OFFSET ?)',
+                           params + (-1 if limit is None else limit, offset),
+                           order_by='c.last_name, c.first_name, c.id')
+
+    def initial_counts(self):
+        """{initial of the last name: number of contacts}"""
+        return dict(self.connection.execute(
+            'SELECT upper(substr(last_name, 1, 1)), count(*) FROM contacts GROUP BY 1 ORDER BY 1'))
@@ -1,25 +1,104 @@
 import datetime
 import re
 
+import render
+
+
+# timestamps are kept as integer microseconds since this (naive) epoch, which round-trips exactly
+EPOCH = datetime.datetime(1970, 1, 1)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
 
 def get_current_time():
     return datetime.datetime.now()
 
 
+def to_epoch_us(time: datetime.datetime):
+    return (time - EPOCH) // ONE_MICROSECOND
+
+
+def from_epoch_us(epoch_us: int):
+    return EPOCH + datetime.timedelta(microseconds=epoch_us)
+
+
+# validators are compiled once at import, they run for every contact built, loaded or imported
+PHONE_NUMBER_PATTERN = re.compile(r'^\(\d{3}\) \d{3}-\d{4}$')
+EMAIL_PATTERN = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+PHONE_NUMBER_ERROR = "Phone number must be in the format (###) ###-####"
+EMAIL_ERROR = "Invalid email address"
+
+# bits of the per-row error mask returned by validate_many
+PHONE_NUMBER_INVALID = 1
+EMAIL_INVALID = 2
+
+
+NON_DIGITS = re.compile(r'\D', re.ASCII)
+
+
+def phone_key(phone_number):
+    """
+    The 10 digits of a phone number as an int, however it is written: '(661) 338-6300', '661.338.6300',
+    '+1 661 338 6300' and 6613386300 all give 6613386300. None when it isn't a 10 digit (NANP) number.
+    """
+    if isinstance(phone_number, int):
+        return phone_number if 0 <= phone_number < 10 ** 10 else None
+    if not phone_number:
+        return None
+    # stored numbers are all (###) ###-####, slicing them is much cheaper than the regex
+    if len(phone_number) == 14 and phone_number[0] == '(' and phone_number[4:6] == ') ' and phone_number[9] == '-':
+        digits = phone_number[1:4] + phone_number[6:9] + phone_number[10:]
+    else:
+        digits = NON_DIGITS.sub('', phone_number)
+        if len(digits) == 11 and digits[0] == '1':
+            # +1 country code
+            digits = digits[1:]
+    if len(digits) != 10 or not digits.isascii() or not digits.isdigit():
+        return None
+    return int(digits)
+
+
+def format_phone_number(key):
+    """phone_key back to the (###) ###-#### format numbers are stored in."""
+    digits = f'{key:010d}'
+    return f'({digits[:3]}) {digits[3:6]}-{digits[6:]}'
+
+
 def validate_phone_number(phone_number):
-    pattern = r'^\(\d{3}\) \d{3}-\d{4}$'
-    if re.match(pattern, phone_number):
+    if PHONE_NUMBER_PATTERN.match(phone_number):
         return phone_number
     else:
-        raise ValueError("Phone number must be in the format (###) ###-####")
+        raise ValueError(PHONE_NUMBER_ERROR)
 
 
 def validate_email(email):
-    pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
-    if re.match(pattern, email):
+    if EMAIL_PATTERN.match(email):
         return email
     else:
-        raise ValueError("Invalid email address")
+        raise ValueError(EMAIL_ERROR)
+
+
+def validate_many(phone_numbers, emails):
+    """
+    Validate a whole chunk of rows at once, without raising.
+
+    Returns one error mask per row: 0 when the row is valid, otherwise PHONE_NUMBER_INVALID and/or EMAIL_INVALID.
+    Emails are optional, an empty one is valid.
+    """
+    phone_match = PHONE_NUMBER_PATTERN.match
+    email_match = EMAIL_PATTERN.match
+    return [(0 if phone_number and phone_match(phone_number) else PHONE_NUMBER_INVALID) |
+            (EMAIL_INVALID if email and not email_match(email) else 0)
+            for phone_number, email in zip(phone_numbers, emails)]
+
+
+def error_mask_message(mask):
+    """Human readable reason for a validate_many error mask."""
+    errors = []
+    if mask & PHONE_NUMBER_INVALID:
+        errors.append(PHONE_NUMBER_ERROR)
+    if mask & EMAIL_INVALID:
+        errors.append(EMAIL_ERROR)
+    return '; '.join(errors)
 
 
 def get_non_empty_input(prompt: str):
@@ -63,18 +142,5 @@ def get_valid_time(prompt: str):
             print("Invalid time format, please try again.")
 
 def print_contacts(contacts):
-    """Helper function to print a list of contacts."""
-    if not contacts:
-        print("No contacts found.")
-        return
-    for contact in contacts:
-        print(f"\n---------------------")
-        print(f"Contact ID: {contact.contact_id} ")
-        print(f"Name: {contact.first_name} {contact.last_name}")
-        print(f"Phone: {contact.phone_number}")
-        if contact.email_address:
-            print(f"Email: {contact.email_address}")
-        if contact.address:
-            print(f"Address: {contact.address}")
-        print(f"Created At: {contact.created_at.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"Updated At: {contact.updated_at.strftime('%Y-%m-%d %H:%M:%S')}")
+    """Helper function to print contacts (any iterable, read lazily), in buffered batches, see render.py."""
+    render.write_contacts(contacts)